@@ -0,0 +1,293 @@
+# Timed benchmark scenarios for the dashboard at several data scales
+# For every scale a synthetic spreadsheet is served by the local Sheets stand-in, and the dashboard code is timed on it:
+#   ingest_api      - load every range from the stand-in (streaming, schema conversion, writing the sheet cache)
+#   ingest_cache    - load every range again from the sheet cache, like a restart within the cache TTL
+#   merge           - join the Sales rows with the Edition, Book and Author sheets
+#   aggregation     - build the Title x Quarter sales cube from the merged rows
+#   layout          - render the page layout (GET /_dash-layout)
+#   book_charts_*   - the update_book_charts callback (POST /_dash-update-component), with the figure cache
+#                     cleared before every call (cold) and with it filled (warm)
+#   daily_trend_*   - the same callback with the trend chart showing orders per day over the whole year
+#   book_search     - the search_books callback, typing titles, author names and ISBNs into the book selector
+# Response sizes are recorded per callback (bytes_per_call as sent, gzip-compressed, and json_bytes_per_call)
+# Results are written to benchmarks/results/<time>.json and compared with the previous run
+#
+# Usage, from the repository root:
+#   python -m benchmarks.run_benchmarks --scales 1 10 100
+import argparse
+import gc
+import gzip
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.sheets_stand_in import StandInProcess
+from sheets_loader import concat_chunks, make_session
+from sheet_cache import SheetCache
+from bookshop_data import SALES_QUARTERS, add_quarter, build_snapshot, load_sheet_frames, merge_sales
+from sales_cube import SalesCube
+from data_refresher import SnapshotStore
+import code_final
+
+# The repository root (the benchmarks are run from there)
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Where the result files go
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+# A scenario counts as a regression when it is this much slower than the previous run (and not just noise)
+REGRESSION_RATIO = 1.25
+REGRESSION_MIN_SECONDS = 0.005
+
+
+# Function to run `function` `repeat` times and return the fastest time in seconds and the last result
+def best_of(function, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+# Function to summarize a list of latencies (seconds) as median and 95th percentile
+def latency_summary(latencies):
+    return {'p50': float(np.percentile(latencies, 50)), 'p95': float(np.percentile(latencies, 95)),
+            'calls': len(latencies)}
+
+
+# Function to join the Sales rows with the (already aligned) dimension sheets of a snapshot, like build_snapshot does
+def merge_frames(frames, snapshot):
+    df_sales = concat_chunks([add_quarter(frames[name], quarter) for name, quarter in SALES_QUARTERS.items()])
+    df_edition = snapshot.dimensions['Edition']
+    df_sales['ISBN'] = pd.Categorical(df_sales['ISBN'], categories=df_edition['ISBN'].cat.categories)
+    return merge_sales(df_sales, df_edition, snapshot.dimensions['Book'], snapshot.dimensions['Author'])
+
+
+# Requests are sent like a browser sends them, accepting gzip-compressed responses
+REQUEST_HEADERS = {'Accept-Encoding': 'gzip'}
+
+
+# Function to get the bytes of a response as sent and as JSON after decompressing
+def response_sizes(response):
+    sent = response.get_data()
+    if response.headers.get('Content-Encoding') == 'gzip':
+        return len(sent), len(gzip.decompress(sent))
+    return len(sent), len(sent)
+
+
+# Function to time the book charts callback for a list of selections through the Dash test client
+def time_book_charts(client, selections, cold, granularity='quarter'):
+    payload = {
+        'output': "..sales-bar-chart.figure...review-bar-chart.figure...sales-trend-line-chart.figure..",
+        'outputs': [{'id': chart, 'property': 'figure'}
+                    for chart in ('sales-bar-chart', 'review-bar-chart', 'sales-trend-line-chart')],
+        'inputs': [
+            {'id': 'book-dropdown', 'property': 'value', 'value': None},
+            {'id': 'trend-granularity', 'property': 'value', 'value': granularity},
+            {'id': 'trend-date-range', 'property': 'start_date', 'value': None},
+            {'id': 'trend-date-range', 'property': 'end_date', 'value': None},
+        ],
+        'changedPropIds': ['book-dropdown.value'],
+        'state': [],
+    }
+    latencies = []
+    response_bytes = 0
+    json_bytes = 0
+    for selected_book in selections:
+        payload['inputs'][0]['value'] = selected_book
+        if cold:
+            code_final.figure_cache.invalidate()
+        start = time.perf_counter()
+        response = client.post("/_dash-update-component", json=payload, headers=REQUEST_HEADERS)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(f"Callback failed with HTTP {response.status_code}: {response.data[:200]}")
+        sent, decoded = response_sizes(response)
+        response_bytes += sent
+        json_bytes += decoded
+    summary = latency_summary(latencies)
+    summary['bytes_per_call'] = response_bytes // len(selections)
+    summary['json_bytes_per_call'] = json_bytes // len(selections)
+    return summary
+
+
+# Function to time the book selector search callback, typing each query one letter at a time
+def time_book_search(client, queries):
+    payload = {
+        'output': "..book-dropdown.options...author-lookup.data..",
+        'outputs': [{'id': 'book-dropdown', 'property': 'options'}, {'id': 'author-lookup', 'property': 'data'}],
+        'inputs': [{'id': 'book-dropdown', 'property': 'search_value', 'value': None}],
+        'changedPropIds': ['book-dropdown.search_value'],
+        'state': [{'id': 'book-dropdown', 'property': 'value', 'value': None}],
+    }
+    latencies = []
+    response_bytes = 0
+    json_bytes = 0
+    for query in queries:
+        for length in range(1, len(query) + 1):
+            payload['inputs'][0]['value'] = query[:length]
+            start = time.perf_counter()
+            response = client.post("/_dash-update-component", json=payload, headers=REQUEST_HEADERS)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError(f"Callback failed with HTTP {response.status_code}: {response.data[:200]}")
+            sent, decoded = response_sizes(response)
+            response_bytes += sent
+            json_bytes += decoded
+    summary = latency_summary(latencies)
+    summary['bytes_per_call'] = response_bytes // len(latencies)
+    summary['json_bytes_per_call'] = json_bytes // len(latencies)
+    return summary
+
+
+# Function to run every scenario at one scale and return the measurements
+def run_scale(scale, repeat, callback_calls, seed):
+    print(f"\n=== Scale {scale}x ===")
+    stand_in = StandInProcess(scale, seed)
+    results = {'scenarios': {}, 'callbacks': {}}
+    scenarios = results['scenarios']
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            session = make_session()
+
+            # Ingest from the API; a TTL of 0 makes every repeat go to the stand-in again
+            api_cache = SheetCache(cache_dir, ttl=0)
+            scenarios['ingest_api'], frames = best_of(
+                lambda: load_sheet_frames("benchmark", api_cache, session, base_url=stand_in.base_url),
+                repeat)
+            stats = stand_in.stats()
+            results['api_requests_per_ingest'] = stats['requests'] // repeat
+            results['api_bytes_per_ingest'] = stats['bytes'] // repeat
+
+            # Ingest again from the cache written by the runs above
+            offline_cache = SheetCache(cache_dir, offline=True)
+            scenarios['ingest_cache'], _ = best_of(
+                lambda: load_sheet_frames("benchmark", offline_cache, session), repeat)
+
+        results['rows'] = {name: len(df) for name, df in frames.items()}
+        snapshot = build_snapshot(frames)
+        scenarios['merge'], df_merged = best_of(lambda: merge_frames(frames, snapshot), repeat)
+        scenarios['aggregation'], _ = best_of(lambda: SalesCube.from_merged(df_merged), repeat)
+        results['merged_rows'] = len(df_merged)
+        results['merged_megabytes'] = round(df_merged.memory_usage(deep=True).sum() / 1e6, 2)
+        del df_merged
+
+        # The Dash app serves the snapshot; requests go through Flask's test client, without a network in between
+        app = code_final.create_app(SnapshotStore(snapshot))
+        client = app.server.test_client()
+        scenarios['layout'], response = best_of(lambda: client.get("/_dash-layout", headers=REQUEST_HEADERS), repeat)
+        results['layout_bytes'], results['layout_json_bytes'] = response_sizes(response)
+
+        # No selection first (the page load), then a spread of titles from the best to the least selling
+        titles = list(snapshot.sales_cube.top_sales['Title']) + list(snapshot.sales_cube.titles)
+        step = max(len(titles) // max(callback_calls - 1, 1), 1)
+        selections = [None] + titles[::step][:callback_calls - 1]
+        results['callbacks']['book_charts_cold'] = time_book_charts(client, selections, cold=True)
+        time_book_charts(client, selections, cold=False)  # Fill the figure cache
+        results['callbacks']['book_charts_warm'] = time_book_charts(client, selections, cold=False)
+        results['callbacks']['daily_trend_cold'] = time_book_charts(client, selections, cold=True, granularity='day')
+        title_search = snapshot.title_search
+        queries = [title_search.titles[-1], title_search.authors[-1], title_search.isbns[-1][0], "the dr"]
+        results['callbacks']['book_search'] = time_book_search(client, queries)
+        for name, summary in results['callbacks'].items():
+            scenarios[name + '_p95'] = summary['p95']
+    finally:
+        stand_in.stop()
+
+    for name, seconds in scenarios.items():
+        print(f"{name:24} {seconds * 1000:10.1f} ms")
+    for name, summary in results['callbacks'].items():
+        print(f"{name + ' bytes/call':24} {summary['bytes_per_call']:10d} sent, "
+              f"{summary['json_bytes_per_call']} as JSON")
+    return results
+
+
+# Function to find the newest earlier result file, or None
+def previous_results_path():
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    names = sorted(name for name in os.listdir(RESULTS_DIR) if name.endswith(".json"))
+    return os.path.join(RESULTS_DIR, names[-1]) if names else None
+
+
+# Function to print how every scenario changed compared with an earlier run; returns the regressions found
+def compare_results(results, previous):
+    regressions = []
+    print(f"\nCompared with {previous['created']} ({previous.get('commit') or 'unknown commit'}):")
+    for scale, scale_results in results['scales'].items():
+        previous_scenarios = previous['scales'].get(scale, {}).get('scenarios', {})
+        for name, seconds in scale_results['scenarios'].items():
+            before = previous_scenarios.get(name)
+            if not before:
+                continue
+            ratio = seconds / before
+            flag = ""
+            if ratio > REGRESSION_RATIO and seconds - before > REGRESSION_MIN_SECONDS:
+                flag = "  <-- slower"
+                regressions.append(f"{scale}x {name}")
+            print(f"{scale:>5}x {name:24} {before * 1000:10.1f} ms -> {seconds * 1000:10.1f} ms  "
+                  f"({ratio:.2f}x){flag}")
+    return regressions
+
+
+# Function to get the commit the benchmarks ran on, if this is a git checkout
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Function to read the command line options
+def parse_args():
+    parser = argparse.ArgumentParser(description="Bookshop dashboard benchmarks")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10],
+                        help="Data scales to run (1 = the real spreadsheet; 1000 needs tens of GB of memory)")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs of each batch scenario; the fastest counts")
+    parser.add_argument('--callback-calls', type=int, default=30, help="Selections timed per callback scenario")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--compare', help="Result file to compare with (default: the newest in benchmarks/results)")
+    parser.add_argument('--no-save', action='store_true', help="Do not write a result file")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    compare_path = args.compare or previous_results_path()
+    results = {
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'commit': current_commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'machine': f"{platform.machine()}, {os.cpu_count()} CPUs",
+        'repeat': args.repeat,
+        'scales': {},
+    }
+    for scale in args.scales:
+        results['scales'][str(scale)] = run_scale(scale, args.repeat, args.callback_calls, args.seed)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+        with open(path, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+        print(f"\nResults written to {path}")
+
+    if compare_path:
+        with open(compare_path) as previous_file:
+            regressions = compare_results(results, json.load(previous_file))
+        if regressions:
+            print(f"Slower than before: {', '.join(regressions)}")
+            sys.exit(1)
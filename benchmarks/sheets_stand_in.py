@@ -0,0 +1,149 @@
+# Local stand-in for the Google Sheets `values` API, serving a synthetic bookshop spreadsheet
+# Answers the same two endpoints the dashboard calls:
+#   GET <base>/<spreadsheet id>/values/<range>?key=...
+#   GET <base>/<spreadsheet id>/values:batchGet?ranges=...&ranges=...&key=...
+# and, like the real API, leaves out trailing empty cells and rows and the 'values' key of an empty range
+#
+# To point the dashboard itself at it:
+#   python -m benchmarks.sheets_stand_in --scale 10 --port 8765
+#   SHEETS_API_BASE=http://127.0.0.1:8765/v4/spreadsheets API_KEY=x python code_final.py
+import argparse
+import json
+import multiprocessing
+import re
+import threading
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.synthetic_sheets import SyntheticBookshop
+
+# Path the stand-in serves under, like https://sheets.googleapis.com/v4/spreadsheets
+API_PATH = "/v4/spreadsheets"
+
+
+# Function to turn a column name such as "A" or "AB" into its 1-based number
+def column_number(column):
+    number = 0
+    for letter in column:
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number
+
+
+# Function to read the values of an A1 range such as "Sales Q1!A1:E5000" or "Book!A1:C59" from the spreadsheet
+def range_values(bookshop, sheet_range):
+    sheet, _, a1 = sheet_range.rpartition("!")
+    match = re.fullmatch(r"([A-Z]+)(\d*):([A-Z]+)(\d*)", a1)
+    if match is None:
+        raise ValueError(f"Unsupported range: {sheet_range}")
+    first_column, first_row, last_column, last_row = match.groups()
+    first_row = int(first_row or 1)
+    last_row = int(last_row) if last_row else bookshop.sheet_length(sheet)
+
+    values = []
+    for row in bookshop.rows(sheet, first_row, last_row):
+        row = row[column_number(first_column) - 1:column_number(last_column)]
+        while row and row[-1] == '':
+            row = row[:-1]  # Trailing empty cells are left out
+        values.append(row)
+    while values and not values[-1]:
+        values.pop()  # So are trailing empty rows
+    return values
+
+
+# Function to build the JSON body the API returns for one range
+def value_range(bookshop, sheet_range):
+    body = {'range': sheet_range, 'majorDimension': 'ROWS'}
+    values = range_values(bookshop, sheet_range)
+    if values:
+        body['values'] = values
+    return body
+
+
+class SheetsRequestHandler(BaseHTTPRequestHandler):
+    # The spreadsheet and the request counters live on the server (self.server)
+    def log_message(self, format, *args):
+        pass  # Keep the benchmark output readable
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        path = urllib.parse.unquote(url.path)
+        query = urllib.parse.parse_qs(url.query)
+        bookshop = self.server.bookshop
+        try:
+            if path == "/stats":
+                body = dict(self.server.stats)
+            elif path.endswith("/values:batchGet"):
+                body = {'valueRanges': [value_range(bookshop, r) for r in query.get('ranges', [])]}
+            elif "/values/" in path:
+                body = value_range(bookshop, path.split("/values/", 1)[1])
+            else:
+                return self.send_json(404, {'error': {'code': 404, 'message': "Not found"}})
+        except (KeyError, ValueError) as error:
+            return self.send_json(400, {'error': {'code': 400, 'message': str(error)}})
+        self.send_json(200, body, count=path != "/stats")
+
+    def send_json(self, status, body, count=True):
+        payload = json.dumps(body).encode()
+        if count:
+            with self.server.stats_lock:
+                self.server.stats['requests'] += 1
+                self.server.stats['bytes'] += len(payload)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+# Function to create the HTTP server for a synthetic spreadsheet (port 0 picks a free port)
+def make_stand_in_server(scale=1, seed=42, host="127.0.0.1", port=0):
+    server = ThreadingHTTPServer((host, port), SheetsRequestHandler)
+    server.daemon_threads = True
+    server.bookshop = SyntheticBookshop(scale, seed)
+    server.stats = {'requests': 0, 'bytes': 0}
+    server.stats_lock = threading.Lock()
+    return server
+
+
+# Function run in the stand-in process: build the spreadsheet, report the port and serve until terminated
+def serve_stand_in(scale, seed, host, port, port_queue):
+    server = make_stand_in_server(scale, seed, host, port)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+class StandInProcess:
+    # Runs the stand-in in its own process, so generating and encoding the sheets does not compete with the
+    # code being measured for the interpreter lock
+    def __init__(self, scale=1, seed=42, host="127.0.0.1"):
+        port_queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=serve_stand_in, args=(scale, seed, host, 0, port_queue),
+                                               daemon=True)
+        self.process.start()
+        self.port = port_queue.get(timeout=600)  # Building a 1000x spreadsheet takes a while
+        self.host = host
+        self.base_url = f"http://{host}:{self.port}{API_PATH}"
+
+    # Requests served and response bytes sent so far
+    def stats(self):
+        with urllib.request.urlopen(f"http://{self.host}:{self.port}/stats") as response:
+            return json.load(response)
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join()
+
+
+# Run the stand-in on its own, for pointing the dashboard at it
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local stand-in for the Google Sheets values API")
+    parser.add_argument('--scale', type=int, default=1, help="Size of the synthetic spreadsheet (1 = the real one)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    server = make_stand_in_server(args.scale, args.seed, args.host, args.port)
+    print(f"Serving a {args.scale}x synthetic bookshop on http://{args.host}:{args.port}{API_PATH}")
+    server.serve_forever()
@@ -0,0 +1,136 @@
+# Synthetic bookshop spreadsheet for the benchmarks
+# Same sheets and columns as the real one, with every sheet multiplied by a scale factor:
+# scale 1 is about the size of the real spreadsheet (58 books, ~56k sales rows), scale 1000 about 56 million sales rows
+import numpy as np
+
+# Sizes of the real spreadsheet at scale 1
+BASE_BOOKS = 58
+BASE_EDITIONS = 95
+BASE_AUTHORS = 41
+BASE_SALES_ROWS = {'Sales Q1': 7785, 'Sales Q2': 13354, 'Sales Q3': 22118, 'Sales Q4': 13093}
+
+# Header row of every sheet
+HEADERS = {
+    'Book': ['BookID', 'Title', 'AuthID'],
+    'Edition': ['ISBN', 'BookID', 'Format', 'PubID', 'Publication Date', 'Pages', 'Print Run Size (k)', 'Price'],
+    'Author': ['AuthID', 'First Name', 'Last Name', 'Birthday', 'Country of Residence', 'Hrs Writing per Day'],
+    'Sales': ['Sale Date', 'ISBN', 'Discount', 'ItemID', 'OrderID'],
+}
+
+# Sales rows are generated in fixed chunks, so a row has the same content whatever block size the loader asks for
+SALES_CHUNK_ROWS = 1000
+
+# Words the synthetic titles and names are made of
+TITLE_WORDS = ['Dragon', 'Moon', 'Shadow', 'Garden', 'River', 'Winter', 'Clockwork', 'Empire', 'Silent', 'Glass',
+               'Star', 'Forest', 'Iron', 'Ocean', 'Crown', 'Ember', 'Hollow', 'Storm', 'Whisper', 'Lantern']
+FIRST_NAMES = ['Ada', 'Ben', 'Chloe', 'Dev', 'Elena', 'Felix', 'Grace', 'Hugo', 'Iris', 'Jonah', 'Kira', 'Leo']
+LAST_NAMES = ['Adams', 'Brooks', 'Chen', 'Diaz', 'Evans', 'Fischer', 'Garcia', 'Hughes', 'Ito', 'Jensen']
+COUNTRIES = ['United States', 'United Kingdom', 'Canada', 'Australia', 'Ireland', 'New Zealand']
+FORMATS = ['Hardcover', 'Trade paperback', 'Mass market paperback', 'Ebook']
+
+
+# Function to format day numbers since 1970-01-01 the way the sheets show dates (M/D/YYYY)
+def format_dates(days):
+    dates = np.datetime64('1970-01-01') + days.astype('timedelta64[D]')
+    years = dates.astype('datetime64[Y]')
+    months = dates.astype('datetime64[M]')
+    month_numbers = (months - years.astype('datetime64[M]')).astype(int) + 1
+    day_numbers = (dates - months.astype('datetime64[D]')).astype(int) + 1
+    year_numbers = years.astype(int) + 1970
+    return [f"{m}/{d}/{y}" for m, d, y in zip(month_numbers, day_numbers, year_numbers)]
+
+
+class SyntheticBookshop:
+    # All sheets of a synthetic spreadsheet, `scale` times the size of the real one
+    # The small Book, Edition and Author sheets are built up front; Sales rows are generated on request from
+    # (seed, sheet, chunk), so even a 1000x spreadsheet never has to be held in memory
+    def __init__(self, scale=1, seed=42):
+        self.scale = scale
+        self.seed = seed
+        self.n_books = BASE_BOOKS * scale
+        self.n_editions = BASE_EDITIONS * scale
+        self.n_authors = BASE_AUTHORS * scale
+        self.sales_rows = {name: rows * scale for name, rows in BASE_SALES_ROWS.items()}
+        rng = np.random.default_rng(seed)
+
+        self.author_ids = [f"AU{i:06d}" for i in range(self.n_authors)]
+        self.authors = [
+            [author_id, FIRST_NAMES[i % len(FIRST_NAMES)], f"{LAST_NAMES[i % len(LAST_NAMES)]}{i}", birthday,
+             COUNTRIES[i % len(COUNTRIES)], str(hours)]
+            for i, (author_id, birthday, hours) in enumerate(zip(
+                self.author_ids, format_dates(rng.integers(-15000, 11000, self.n_authors)),
+                rng.integers(1, 9, self.n_authors)))
+        ]
+
+        self.book_ids = [f"BK{i:06d}" for i in range(self.n_books)]
+        words = rng.integers(0, len(TITLE_WORDS), (self.n_books, 2))
+        self.books = [
+            [book_id, f"The {TITLE_WORDS[a]} of the {TITLE_WORDS[b]} {i + 1}", self.author_ids[author]]
+            for i, (book_id, (a, b), author) in enumerate(zip(
+                self.book_ids, words, rng.integers(0, self.n_authors, self.n_books)))
+        ]
+
+        # Every book has at least one edition; the rest go to random books
+        edition_books = np.concatenate([np.arange(self.n_books),
+                                        rng.integers(0, self.n_books, self.n_editions - self.n_books)])
+        self.isbns = [f"978-{i:09d}" for i in range(self.n_editions)]
+        self.editions = [
+            [isbn, self.book_ids[book], FORMATS[i % len(FORMATS)], f"P{i % 7:02d}", published, str(pages),
+             str(print_run), f"{price:.2f}"]
+            for i, (isbn, book, published, pages, print_run, price) in enumerate(zip(
+                self.isbns, edition_books, format_dates(rng.integers(10000, 19000, self.n_editions)),
+                rng.integers(120, 900, self.n_editions), rng.integers(1, 60, self.n_editions),
+                rng.uniform(5, 40, self.n_editions)))
+        ]
+
+    # Total number of rows of a sheet, header included
+    def sheet_length(self, sheet):
+        if sheet in self.sales_rows:
+            return self.sales_rows[sheet] + 1
+        return len(self.dimension_rows(sheet)) + 1
+
+    def dimension_rows(self, sheet):
+        return {'Book': self.books, 'Edition': self.editions, 'Author': self.authors}[sheet]
+
+    # Rows first_row..last_row (1-based sheet rows, inclusive, row 1 is the header) of a sheet
+    def rows(self, sheet, first_row, last_row):
+        last_row = min(last_row, self.sheet_length(sheet))
+        if first_row > last_row:
+            return []
+        if sheet in self.sales_rows:
+            header = [HEADERS['Sales']] if first_row == 1 else []
+            return header + self.sales_data_rows(sheet, max(first_row - 1, 1) - 1, last_row - 1)
+        table = [HEADERS[sheet]] + self.dimension_rows(sheet)
+        return table[first_row - 1:last_row]
+
+    # Data rows start..stop (0-based, stop exclusive) of a Sales sheet
+    def sales_data_rows(self, sheet, start, stop):
+        rows = []
+        for chunk in range(start // SALES_CHUNK_ROWS, (stop - 1) // SALES_CHUNK_ROWS + 1):
+            chunk_rows = self.sales_chunk(sheet, chunk)
+            chunk_start = chunk * SALES_CHUNK_ROWS
+            rows.extend(chunk_rows[max(start - chunk_start, 0):stop - chunk_start])
+        return rows
+
+    # One chunk of SALES_CHUNK_ROWS generated Sales rows
+    def sales_chunk(self, sheet, chunk):
+        quarter = list(BASE_SALES_ROWS).index(sheet)
+        first = chunk * SALES_CHUNK_ROWS
+        n_rows = min(SALES_CHUNK_ROWS, self.sales_rows[sheet] - first)
+        rng = np.random.default_rng([self.seed, quarter, chunk])
+
+        # A few editions sell far more than the rest, like real bestsellers
+        editions = np.minimum((self.n_editions * rng.random(n_rows) ** 3).astype(int), self.n_editions - 1)
+        quarter_start = (np.datetime64(f'2022-{quarter * 3 + 1:02d}-01') - np.datetime64('1970-01-01')).astype(int)
+        sale_dates = format_dates(quarter_start + rng.integers(0, 90, n_rows))
+        discounts = rng.choice(['', '0.05', '0.1', '0.15', '0.2'], n_rows)
+        row_numbers = np.arange(first, first + n_rows)
+
+        rows = []
+        for row_number, sale_date, edition, discount in zip(row_numbers, sale_dates, editions, discounts):
+            row = [sale_date, self.isbns[edition], str(discount), f"I{quarter}{row_number:09d}",
+                   f"O{quarter}{row_number * 2 // 3:09d}"]  # Most orders have one item, some have two
+            if row_number % 50 == 49:
+                row = row[:3]  # Some rows have no item or order
+            rows.append(row)
+        return rows
@@ -0,0 +1,218 @@
+# Loading and merging of the bookshop data
+# The result of one load is a DataSnapshot: an immutable bundle of the merged table and its aggregates that the
+# dashboard reads from and that the background refresher replaces as a whole
+import numpy as np
+import pandas as pd
+
+from sheets_loader import SHEET_RANGES, concat_chunks
+from sheet_schema import align_categories, apply_schema, has_schema_dtypes, print_schema_report
+from sheet_cache import frame_content_hash, load_ranges_cached
+from sales_cube import INPUT_COLUMNS as CUBE_COLUMNS, SalesCube
+from sales_timeseries import INPUT_COLUMNS as TIMESERIES_COLUMNS, SalesTimeSeries
+from title_search import TitleSearchIndex
+from metrics import metrics
+
+# Which declared schema (see sheet_schema.py) each range follows
+RANGE_SCHEMAS = {
+    'Book': 'Book',
+    'Sales Q1': 'Sales',
+    'Sales Q2': 'Sales',
+    'Sales Q3': 'Sales',
+    'Sales Q4': 'Sales',
+    'Edition': 'Edition',
+    'Author': 'Author',
+}
+
+# Quarter label of each Sales range
+SALES_QUARTERS = {'Sales Q1': 'Q1', 'Sales Q2': 'Q2', 'Sales Q3': 'Q3', 'Sales Q4': 'Q4'}
+QUARTER_DTYPE = pd.CategoricalDtype(list(SALES_QUARTERS.values()))
+
+# Small lookup sheets joined onto the sales rows
+DIMENSION_RANGES = ['Book', 'Edition', 'Author']
+
+# Columns the joined sales rows are made of: only what the aggregates read, not every column of every sheet
+MERGED_COLUMNS = list(dict.fromkeys(CUBE_COLUMNS + TIMESERIES_COLUMNS))
+
+
+# Function to build the converters that apply each range's schema on ingest (to every block of a streamed sheet)
+# Rejected rows, bad values and memory savings are collected in `report`
+def make_schema_converters(report=None):
+    def make_converter(name):
+        def convert(df):
+            with metrics.stage('schema_convert') as span:
+                df = apply_schema(df, RANGE_SCHEMAS[name], report, label=name)
+                span.rows = len(df)
+            return df
+        return convert
+    return {name: make_converter(name) for name in RANGE_SCHEMAS}
+
+
+# Function to load every range in SHEET_RANGES through the cache as typed DataFrames
+def load_sheet_frames(api_key, cache, session=None, batch=False, base_url=None):
+    report = {}
+    frames, _ = load_ranges_cached(SHEET_RANGES, api_key, cache, batch=batch, session=session, base_url=base_url,
+                                   converters=make_schema_converters(report))
+    print_schema_report(report)
+
+    # Snapshots cached by an older version may still hold plain strings: only those get the schema applied again
+    for name, df in frames.items():
+        if len(df) and not has_schema_dtypes(df, RANGE_SCHEMAS[name]):
+            sheet_rows = df.attrs.get('sheet_rows')
+            frames[name] = apply_schema(df, RANGE_SCHEMAS[name])
+            frames[name].attrs['sheet_rows'] = sheet_rows
+    return frames
+
+
+# Function to add a 'Quarter' column to a sales DataFrame to indicate which quarter the sales data belongs to
+def add_quarter(df_sales, quarter):
+    return df_sales.assign(Quarter=pd.Series(quarter, index=df_sales.index, dtype=QUARTER_DTYPE))
+
+
+# Function to find, for every row of a fact key column, the row of the dimension sheet with the same key (-1 if none)
+# Works on the integer codes of the categoricals: one array lookup per row instead of a hash join
+def lookup_rows(fact_key, dimension_key):
+    if not isinstance(fact_key.dtype, pd.CategoricalDtype):
+        fact_key = fact_key.astype('category')
+    categories = fact_key.cat.categories
+    dimension_codes = pd.Categorical(dimension_key, categories=categories).codes
+    positions = np.full(len(categories) + 1, -1, dtype=np.int64)  # The extra last slot answers missing keys (-1)
+    known = np.flatnonzero(dimension_codes >= 0)[::-1]
+    positions[dimension_codes[known]] = known  # Keys are unique per sheet; if not, the first row wins
+    return positions[fact_key.cat.codes.to_numpy()]
+
+
+# Function to join sales rows with the edition, book and author details
+# Only `columns` are produced: each is gathered straight from the sheet that has it, following the ISBN -> BookID ->
+# AuthID keys, so nothing else of the (wide) sheets is copied. Like the merges it replaces, sales rows without a known
+# edition or book are dropped and rows without a known author keep missing names
+def merge_sales(df_sales, df_edition, df_books, df_authors, columns=MERGED_COLUMNS):
+    with metrics.stage('merge') as span:
+        # Sales -> Edition on ISBN (inner join)
+        edition_rows = lookup_rows(df_sales['ISBN'], df_edition['ISBN'])
+        sales_rows = np.flatnonzero(edition_rows >= 0)
+        edition_rows = edition_rows[sales_rows]
+
+        # Edition -> Book on BookID (inner join)
+        book_rows = lookup_rows(df_edition['BookID'], df_books['BookID'])[edition_rows]
+        found = book_rows >= 0
+        sales_rows, edition_rows, book_rows = sales_rows[found], edition_rows[found], book_rows[found]
+
+        # Book -> Author on AuthID (left join: -1 where the author is unknown)
+        author_rows = lookup_rows(df_books['AuthID'], df_authors['AuthID'])[book_rows]
+
+        sources = [(df_sales, sales_rows), (df_edition, edition_rows), (df_books, book_rows),
+                   (df_authors, author_rows)]
+        data = {}
+        for column in columns:
+            for frame, rows in sources:
+                if column in frame:
+                    data[column] = frame[column].array.take(rows, allow_fill=True)  # -1 becomes a missing value
+                    break
+        df_merged = pd.DataFrame(data, index=pd.RangeIndex(len(sales_rows)))
+        span.rows = len(df_merged)
+
+    # If the 'Rating' column does not exist, generate random ratings between 1 and 5
+    if 'Rating' in columns and 'Rating' not in df_merged.columns:
+        df_merged['Rating'] = np.random.randint(1, 6, size=len(df_merged)).astype('int8')
+    return df_merged
+
+
+# Function to list the ISBNs of the editions of every title in `titles`, from the Edition and Book sheets
+def isbns_by_title(df_edition, df_books, titles):
+    book_rows = lookup_rows(df_edition['BookID'], df_books['BookID'])
+    known = book_rows >= 0
+    editions = pd.DataFrame({'Title': df_books['Title'].to_numpy()[book_rows[known]],
+                             'ISBN': df_edition['ISBN'].to_numpy()[known]})
+    isbns = editions.groupby('Title', sort=False)['ISBN'].agg(list).to_dict()
+    return [[str(isbn) for isbn in isbns.get(title, [])] for title in titles]
+
+
+# Function to build the book selector's search index for the titles of a sales cube
+def build_title_search(sales_cube, dimensions):
+    with metrics.stage('title_search') as span:
+        isbns = isbns_by_title(dimensions['Edition'], dimensions['Book'], sales_cube.titles)
+        title_search = TitleSearchIndex.from_titles(sales_cube.titles, sales_cube.authors, isbns,
+                                                    sales_cube.book_sales['Total Sales'].to_numpy())
+        span.rows = len(title_search.words)
+    return title_search
+
+
+class DataSnapshot:
+    # Everything the dashboard reads, from one consistent load of the sheets
+    # Never modified after it is built: a refresh builds a new snapshot and swaps it in
+    def __init__(self, version, dimensions, range_hashes, sales_headers, sheet_rows, df_merged, sales_cube,
+                 sales_timeseries, title_search):
+        self.version = version
+        self.dimensions = dimensions  # Book, Edition and Author with aligned key categories
+        self.range_hashes = range_hashes  # Content hash of every range this snapshot was built from
+        self.sales_headers = sales_headers  # Column names of each Sales sheet
+        self.sheet_rows = sheet_rows  # Rows read from each Sales sheet, so a refresh can read only new ones
+        self.df_merged = df_merged
+        self.sales_cube = sales_cube
+        self.sales_timeseries = sales_timeseries  # Daily orders per title, in the same title order as the cube
+        self.title_search = title_search  # Titles, authors and ISBNs the book selector searches
+
+
+# Function to build a snapshot from freshly loaded frames
+def build_snapshot(frames, version=1):
+    sheet_rows = {name: frames[name].attrs.get('sheet_rows') or len(frames[name]) for name in SALES_QUARTERS}
+    sales_headers = {name: list(frames[name].columns) for name in SALES_QUARTERS}
+    range_hashes = {name: frame_content_hash(df) for name, df in frames.items()}
+
+    # Concatenate all sales data into a single DataFrame (combining the quarterly data)
+    df_sales = concat_chunks([add_quarter(frames[name], quarter) for name, quarter in SALES_QUARTERS.items()])
+
+    # Give the join keys identical categories in every sheet
+    df_books, df_edition, df_authors = frames['Book'], frames['Edition'], frames['Author']
+    df_sales, df_edition = align_categories([df_sales, df_edition], 'ISBN')
+    df_edition, df_books = align_categories([df_edition, df_books], 'BookID')
+    df_books, df_authors = align_categories([df_books, df_authors], 'AuthID')
+
+    df_merged = merge_sales(df_sales, df_edition, df_books, df_authors)
+    del df_sales
+    print(f"df_merged: {len(df_merged)} rows, {df_merged.memory_usage(deep=True).sum() / 1e6:.2f} MB in memory")
+
+    # Aggregate everything the callbacks need by title and quarter once, so no callback has to scan df_merged
+    with metrics.stage('aggregate') as span:
+        sales_cube = SalesCube.from_merged(df_merged)
+        span.rows = len(sales_cube.titles)
+    with metrics.stage('timeseries') as span:
+        sales_timeseries = SalesTimeSeries.from_merged(df_merged, sales_cube.titles)
+        span.rows = sales_timeseries.n_days
+    dimensions = {'Book': df_books, 'Edition': df_edition, 'Author': df_authors}
+    title_search = build_title_search(sales_cube, dimensions)
+    return DataSnapshot(version, dimensions, range_hashes, sales_headers, sheet_rows, df_merged, sales_cube,
+                        sales_timeseries, title_search)
+
+
+# Function to build the next snapshot from Sales rows appended since `snapshot` was built
+# `deltas` maps a Sales range name to its new typed rows; only those rows are merged and counted
+def apply_sales_delta(snapshot, deltas):
+    df_new_sales = concat_chunks([add_quarter(df, SALES_QUARTERS[name]) for name, df in deltas.items() if len(df)])
+    df_edition = snapshot.dimensions['Edition']
+    if len(df_new_sales):
+        # Use the ISBN categories of the Edition sheet; ISBNs it does not know are dropped by the inner join anyway
+        df_new_sales['ISBN'] = pd.Categorical(df_new_sales['ISBN'], categories=df_edition['ISBN'].cat.categories)
+        df_delta = merge_sales(df_new_sales, df_edition, snapshot.dimensions['Book'], snapshot.dimensions['Author'])
+    else:
+        df_delta = snapshot.df_merged.iloc[:0]
+
+    with metrics.stage('aggregate_delta') as span:
+        sales_cube = snapshot.sales_cube.with_delta(df_delta)
+        sales_timeseries = snapshot.sales_timeseries.with_delta(df_delta, sales_cube.titles)
+        span.rows = len(df_delta)
+    df_merged = snapshot.df_merged
+    if len(df_delta):
+        df_merged = concat_chunks([df_merged, df_delta])
+
+    sheet_rows = dict(snapshot.sheet_rows)
+    range_hashes = dict(snapshot.range_hashes)
+    for name, df in deltas.items():
+        sheet_rows[name] += df.attrs.get('sheet_rows', len(df))
+        range_hashes[name] = None  # No longer the hash of a whole range
+    # New sales change the ranking (and may bring titles that had none before), so the search index is rebuilt
+    title_search = snapshot.title_search
+    if sales_cube is not snapshot.sales_cube:
+        title_search = build_title_search(sales_cube, snapshot.dimensions)
+    return DataSnapshot(snapshot.version + 1, snapshot.dimensions, range_hashes, snapshot.sales_headers, sheet_rows,
+                        df_merged, sales_cube, sales_timeseries, title_search)
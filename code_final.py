@@ -1,15 +1,28 @@
 # Importing required libraries
 # These libraries are essential for web scraping, creating the dashboard, handling data, and visualizing it
-import requests
 import dash
 from dash import dcc, html
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output
-import pandas as pd
+from dash.dependencies import Input, Output, State
 import plotly.express as px
-import numpy as np
 from dotenv import load_dotenv  # Correct library for environment variables
 import os
+import argparse
+import logging
+import subprocess
+import sys
+import time
+import json
+import gzip
+from flask import request
+from sheets_loader import make_session
+from sheet_cache import SheetCache
+from bookshop_data import build_snapshot, load_sheet_frames
+from data_refresher import BackgroundLoader, DataRefresher, SnapshotStore
+from figure_cache import FigureCache
+from snapshot_files import write_snapshot
+from production_server import run_production_server
+from metrics import add_metrics_route, metrics
 
 # Load environment variables from .env file
 load_dotenv()
@@ -18,275 +31,50 @@ load_dotenv()
 api_key = os.getenv("API_KEY")  # Replace "API_KEY" with the variable name in your .env file
 
 
-# Function to fetch data from Google Sheets using an API
-def fetch_google_sheet_data(url):
-    # Making an HTTP GET request to the provided Google Sheets API URL
-    response = requests.get(url)
-    if response.status_code == 200:  # Check if the request was successful
-        data = response.json()  # Parse the response as JSON data
-        values = data.get('values', [])  # Extract the data values from the JSON
-        if values:
-            header = values[0]  # First row contains the column headers
-            rows = values[1:]  # The rest of the rows contain the actual data
-            df = pd.DataFrame(rows, columns=header)  # Convert the rows into a pandas DataFrame
-            return df  # Return the DataFrame with the data
-        else:
-            print("No data found in the sheet")  # Print message if no data is found
-            return pd.DataFrame()  # Return an empty DataFrame if no data
+# One keep-alive connection pool shared by every request to the Sheets API
+session = make_session()
+
+# Function to load the data into a snapshot store and keep it fresh in the background
+# All stale ranges in SHEET_RANGES are streamed concurrently in blocks of SHEETS_BLOCK_ROWS rows (with
+# SHEETS_BATCH_GET=1 the first block of every range comes in one batchGet request), and a refresher polls the sheets
+# every REFRESH_INTERVAL seconds (0 turns it off)
+# With background=True the store is returned straight away and the first snapshot is loaded by a background thread
+def load_data_store(offline=False, background=False):
+    # On-disk snapshots of every range (see SHEETS_CACHE_DIR / SHEETS_CACHE_TTL), used as-is in offline mode
+    sheet_cache = SheetCache(offline=offline)
+    use_batch_get = os.getenv("SHEETS_BATCH_GET", "0") == "1"
+    data_store = SnapshotStore()
+
+    def load_snapshot():
+        return build_snapshot(load_sheet_frames(api_key, sheet_cache, session, batch=use_batch_get))
+
+    def start_refresher(snapshot):
+        refresh_interval = float(os.getenv("REFRESH_INTERVAL", "300"))
+        if refresh_interval > 0 and not offline:
+            data_store.refresher = DataRefresher(data_store, api_key, sheet_cache, interval=refresh_interval,
+                                                 session=session)
+            data_store.refresher.start()
+
+    if background:
+        BackgroundLoader(data_store, load_snapshot, on_loaded=start_refresher).start()
     else:
-        # If the HTTP request fails (not a status code 200)
-        print(f"Failed to fetch data. HTTP Status Code: {response.status_code}")
-        return pd.DataFrame()  # Return an empty DataFrame if the request fails
-
-# URLs to fetch data from multiple Google Sheets
-# These URLs point to the Google Sheets API endpoints for fetching various types of data
-book_url = "https://sheets.googleapis.com/v4/spreadsheets/1d974FnqiPtsTgekWMJBuD8mkeN0v7xo2MpBUhd_CNKw/values/Book!A1:C59?key=" + api_key
-edition_url = "https://sheets.googleapis.com/v4/spreadsheets/1d974FnqiPtsTgekWMJBuD8mkeN0v7xo2MpBUhd_CNKw/values/Edition!A1:H96?key="  + api_key
-sales_q1_url = "https://sheets.googleapis.com/v4/spreadsheets/1d974FnqiPtsTgekWMJBuD8mkeN0v7xo2MpBUhd_CNKw/values/Sales Q1!A1:E7786?key="  + api_key
-sales_q2_url = "https://sheets.googleapis.com/v4/spreadsheets/1d974FnqiPtsTgekWMJBuD8mkeN0v7xo2MpBUhd_CNKw/values/Sales Q2!A1:E13355?key="  + api_key
-sales_q3_url = "https://sheets.googleapis.com/v4/spreadsheets/1d974FnqiPtsTgekWMJBuD8mkeN0v7xo2MpBUhd_CNKw/values/Sales Q3!A1:E22119?key="  + api_key
-sales_q4_url = "https://sheets.googleapis.com/v4/spreadsheets/1d974FnqiPtsTgekWMJBuD8mkeN0v7xo2MpBUhd_CNKw/values/Sales Q4!A1:E13094?key="  + api_key
-author_url = "https://sheets.googleapis.com/v4/spreadsheets/1d974FnqiPtsTgekWMJBuD8mkeN0v7xo2MpBUhd_CNKw/values/Author!A1:F42?key="  + api_key
-
-# Load data from the Google Sheets URLs into pandas DataFrames
-# We are calling the `fetch_google_sheet_data` function to get data from each URL
-df_books = fetch_google_sheet_data(book_url)
-df_sales_q1 = fetch_google_sheet_data(sales_q1_url)
-df_sales_q2 = fetch_google_sheet_data(sales_q2_url)
-df_sales_q3 = fetch_google_sheet_data(sales_q3_url)
-df_sales_q4 = fetch_google_sheet_data(sales_q4_url)
-df_edition = fetch_google_sheet_data(edition_url)
-df_authors = fetch_google_sheet_data(author_url)
-
-# Add a 'Quarter' column to each sales DataFrame to indicate which quarter the sales data belongs to
-df_sales_q1['Quarter'] = 'Q1'
-df_sales_q2['Quarter'] = 'Q2'
-df_sales_q3['Quarter'] = 'Q3'
-df_sales_q4['Quarter'] = 'Q4'
-
-# Concatenate all sales data into a single DataFrame (combining the quarterly data)
-df_sales = pd.concat([df_sales_q1, df_sales_q2, df_sales_q3, df_sales_q4])
-
-# Merge sales data with edition and book details based on ISBN and BookID
-df_merged = pd.merge(df_sales, df_edition, on='ISBN', how='inner')
-df_merged = pd.merge(df_merged, df_books, on='BookID', how='inner')
-
-# Merge author details with the combined data based on AuthID
-df_merged = pd.merge(df_merged, df_authors, on='AuthID', how='left')
-
-# If the 'Rating' column does not exist, generate random ratings between 1 and 5
-if 'Rating' not in df_merged.columns:
-    df_merged['Rating'] = np.random.randint(1, 6, size=len(df_merged))
-
-# Calculate the total sales for each book by counting the number of orders per book
-df_merged['Total Sales'] = df_merged.groupby('Title')['OrderID'].transform('count')
-
-# Aggregate total sales and average ratings by book title
-book_sales = df_merged.groupby('Title')['Total Sales'].sum().reset_index()
-book_ratings = df_merged.groupby('Title')['Rating'].mean().reset_index()
-
-# Prepare the dropdown options for the books by iterating through the book_sales DataFrame
-books_options = []
-for index, row in book_sales.iterrows():
-    book_option = {'label': row['Title'], 'value': row['Title']}  # For each book, create a dropdown option
-    books_options.append(book_option)
-
-# Get the top 10 best-selling books based on total sales
-top_10_books = book_sales.sort_values(by='Total Sales', ascending=False).head(10)
-
-# Initialize the Dash app and set up the layout
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.CERULEAN])
-
-app.layout = html.Div([
-    # Header Section
-    dbc.Row([
-        dbc.Col([
-            html.H1("📚 Bookshop Dashboard", style={
-                'textAlign': 'center',
-                'fontSize': '48px',
-                'marginBottom': '10px'
-            }),
-            html.H5("Visualizing book sales and trends interactively", style={
-                'textAlign': 'center',
-                'color': '#5D4037',
-                'fontStyle': 'italic'
-            })
-        ])
-    ], style={'marginBottom': '30px'}),
-
-    # Statistics Cards
-    dbc.Row([
-        dbc.Col([
-            dbc.Card([
-                dbc.CardBody([
-                    html.H5("Total Sales", className="card-title", style={'textAlign': 'center'}),
-                    html.P(f"{book_sales['Total Sales'].sum()} books sold", className="card-text",
-                           style={'textAlign': 'center', 'fontSize': '20px'}),
-                    html.I(className="bi bi-graph-up-arrow",
-                           style={'fontSize': '40px', 'color': '#FFD700', 'textAlign': 'center'})
-                ])
-            ], color="primary", inverse=True, style={'margin': '10px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.2)'})
-        ], width=4),
-
-        dbc.Col([
-            dbc.Card([
-                dbc.CardBody([
-                    html.H5("Total Books", className="card-title", style={'textAlign': 'center'}),
-                    html.P(f"{len(book_sales)} unique titles", className="card-text",
-                           style={'textAlign': 'center', 'fontSize': '20px'}),
-                    html.I(className="bi bi-book-fill",
-                           style={'fontSize': '40px', 'color': '#FFD700', 'textAlign': 'center'})
-                ])
-            ], color="success", inverse=True, style={'margin': '10px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.2)'})
-        ], width=4),
-
-        dbc.Col([
-            dbc.Card([
-                dbc.CardBody([
-                    html.H5("Top Genre", className="card-title", style={'textAlign': 'center'}),
-                    html.P("Sci-Fi/Fantasy", className="card-text", style={'textAlign': 'center', 'fontSize': '20px'}),
-                    html.I(className="bi bi-star-fill",
-                           style={'fontSize': '40px', 'color': '#FFD700', 'textAlign': 'center'})
-                ])
-            ], color="info", inverse=True, style={'margin': '10px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.2)'})
-        ], width=4)
-    ]),
-
-    # Layout - Book Selection and Author Name Section
-    dbc.Row([  # A Bootstrap row containing the dropdown and author name
-        # Select Book Dropdown
-        dbc.Col([  # First column for the dropdown
-            html.H3("Book Name", style={  # Label for the dropdown
-                'textAlign': 'center',  # Center-aligned text
-                'marginBottom': '15px',  # Space below the label
-                'marginTop': '20px',  # Space below the label
-                'fontSize': '20px',  # Font size
-                'color': 'black',  # White text for visibility
-                'fontWeight': 'bold',  # Bold font
-                'fontFamily': 'Arial, sans-serif'  # Font style
-            }),
-            dcc.Dropdown(  # Dropdown for selecting a book
-                id='book-dropdown',  # Unique ID for callback functionality
-                options=books_options,  # Options for the dropdown
-                placeholder="Please select a book",  # Placeholder text
-                style={  # Styling for the dropdown
-                    'width': '100%',  # Full width
-                    'fontSize': '15px',  # Font size
-                    'padding': '15px',  # Padding inside the dropdown
-                    'borderRadius': '8px',  # Rounded corners
-                    'border': '1px solid #BDC3C7',  # Light border
-                    'backgroundColor': '#ECF0F1',  # Light gray background
-                    'color': 'black',  # Black text color
-                    'textAlign': 'center',  # Center-aligned placeholder
-                }
-            ),
-        ], width=6, style={'paddingLeft': '30px'}),  # Column width and left padding
-
-        # Layout- Author Name Box
-        dbc.Col([  # Second column for the author name card
-            html.H3("Author Name", style={  # Label for the author name
-                'textAlign': 'center',  # Center-aligned text
-                'marginBottom': '15px',  # Space below the label
-                'marginTop': '20px',
-                'fontWeight': 'bold',
-                'fontSize': '20px',  # Font size
-                'color': 'black',  # White text for visibility
-                'fontFamily': 'Arial, sans-serif'  # Font style
-            }),
-            dbc.Card(  # Card to display the author name
-                dbc.CardBody([
-                    html.Div(id='author-name', style={  # Placeholder for dynamic author name
-                        'fontSize': '24px',  # Font size
-                        'fontWeight': 'bold',  # Bold font
-                        'padding': '15px',  # Padding inside the card
-                        'border': '1px solid #BDC3C7',  # Border around the text
-                        'borderRadius': '8px',  # Rounded corners
-                        'backgroundColor': '#ECF0F1',  # Light background color
-                        'textAlign': 'center',  # Center-aligned text
-                        'color': 'black'  # Black text color
-                    })
-                ]),
-                style={  # Styling for the card
-                    'borderRadius': '8px',  # Rounded corners for the card
-                    'backgroundColor': '#fff'  # White background for contrast
-                }
-            )
-        ], width=5, style={'paddingLeft': '30px'}),  # Column width and left padding
-    ], style={'marginBottom': '20px'}),  # Space between this row and the next
-
-    # Layout- Book Output Row
-    dbc.Row([  # Row to display additional book-related information
-        dbc.Col(html.Div(id='book-output'), width=6, style={'padding': '10px'})
-    ], style={'marginBottom': '20px'}),
-
-    # Sales and Review Charts Row
-    dbc.Row([  # Row for sales and review charts
-        dbc.Col([  # First column for the sales bar chart
-            dcc.Graph(
-                id='sales-bar-chart',  # Unique ID for callback functionality
-                config={'displayModeBar': False},  # Hide extra toolbar
-                style={  # Styling for the chart
-                    'height': '800px',  # Height for larger charts
-                    'padding': '20px'  # Uniform padding
-                }
-            )
-        ], width=6, style={'padding': '10px'}),  # Column width and padding
-        dbc.Col([  # Second column for the review bar chart
-            dcc.Graph(
-                id='review-bar-chart',  # Unique ID for callback functionality
-                config={'displayModeBar': False},  # Hide extra toolbar
-                style={  # Styling for the chart
-                    'height': '800px',  # Height for larger charts
-                    'padding': '20px'  # Uniform padding
-                }
-            )
-        ], width=6, style={'padding': '10px'})  # Column width and padding
-    ], style={'marginBottom': '20px'}),
-
-    # Layout - Sales Trend Line Chart Row
-    dbc.Row([  # Row for the sales trend and top 10 books charts
-        dbc.Col([  # First column for the sales trend line chart
-            dcc.Graph(
-                id='sales-trend-line-chart',  # Unique ID for callback functionality
-                config={'displayModeBar': False},  # Hide extra toolbar
-                style={  # Styling for the chart
-                    'height': '800px',  # Height for larger charts
-                    'padding': '20px'  # Uniform padding
-                }
-            )
-        ], width=6, style={'padding': '20px'}),  # Column width and padding
-
-        # Layout - Top 10 Selling Books Chart
-        dbc.Col([  # Second column for the top 10 selling books bar chart
-            html.H3(style={  # Placeholder for any additional heading
-                'textAlign': 'center',  # Center-aligned text
-                'marginBottom': '20px',  # Space below the heading
-                'fontSize': '24px',  # Font size
-                'fontWeight': 'bold',  # Bold font
-                'color': '#2980B9',  # Blue text color
-                'fontFamily': 'Arial, sans-serif'  # Font style
-            }),
-            dcc.Graph(
-                id='top-10-books-bar-chart',  # Unique ID for callback functionality
-                config={'displayModeBar': False},  # Hide extra toolbar
-                style={  # Styling for the chart
-                    'height': '800px',  # Height for larger charts
-                    'padding': '20px'  # Uniform padding
-                }
-            )
-        ], width=6, style={'padding': '10px'})  # Column width and padding
-    ], style={'marginBottom': '20px'})
-
-], style={'backgroundColor': '#EAF6F6', 'color': '#084C61'})  # Overall dashboard background and text color
-
-# This section handles the callback logic to update the graphs based on the dropdown selection
-# Callback to update the sales chart
-
-@app.callback(Output('sales-bar-chart', 'figure'), Input('book-dropdown', 'value'))
-def update_sales_chart(selected_book):
+        data_store.swap(load_snapshot())
+        start_refresher(data_store.snapshot)
+    return data_store
+
+# Figures already built for a (callback, selected book) pair; cleared whenever a new snapshot is swapped in
+# Line charts keep at most PLOT_WIDTH_PX points, about one per pixel across a chart
+figure_cache = FigureCache(max_entries=int(os.getenv("FIGURE_CACHE_SIZE", "256")),
+                           max_points=int(os.getenv("PLOT_WIDTH_PX", "800")))
+
+# Functions that build the dashboard figures from a data snapshot; each one is memoized per selected book
+# Function to build the sales chart
+@figure_cache.memoize('sales-bar-chart')
+def build_sales_chart(snapshot, selected_book):
+    sales_cube = snapshot.sales_cube
     if selected_book:
-        # Filter for selected book
-        filtered_sales = book_sales[book_sales['Title'] == selected_book]
+        # Look up the selected book
+        filtered_sales = sales_cube.title_sales(selected_book)
         fig = px.bar(
             filtered_sales,
             x='Title',
@@ -298,9 +86,8 @@ def update_sales_chart(selected_book):
         )
     else:
         # Show top 10 books by total sales
-        top_sales = book_sales.sort_values(by='Total Sales', ascending=False).head(10)
         fig = px.bar(
-            top_sales,
+            sales_cube.top_sales,
             x='Title',
             y='Total Sales',
             title="Top 10 Books by Total Sales",
@@ -316,12 +103,13 @@ def update_sales_chart(selected_book):
 
     return fig
 
-# Callback to update the review chart
-@app.callback(Output('review-bar-chart', 'figure'), Input('book-dropdown', 'value'))
-def update_review_chart(selected_book):
+# Function to build the review chart
+@figure_cache.memoize('review-bar-chart')
+def build_review_chart(snapshot, selected_book):
+    sales_cube = snapshot.sales_cube
     if selected_book:
-        # Filter for selected book
-        filtered_reviews = book_ratings[book_ratings['Title'] == selected_book]
+        # Look up the selected book
+        filtered_reviews = sales_cube.title_rating(selected_book)
         fig = px.bar(
             filtered_reviews,
             x='Title',
@@ -333,9 +121,8 @@ def update_review_chart(selected_book):
         )
     else:
         # Show top 10 books by average rating
-        top_ratings = book_ratings.sort_values(by='Rating', ascending=False).head(10)
         fig = px.bar(
-            top_ratings,
+            sales_cube.top_ratings,
             x='Title',
             y='Rating',
             title="Top 10 Books by Average Rating",
@@ -351,15 +138,26 @@ def update_review_chart(selected_book):
     return fig
 
 
-# Callback to update the sales trend line chart
-@app.callback(Output('sales-trend-line-chart', 'figure'), Input('book-dropdown', 'value')
-)
-def update_sales_trend_chart(selected_book):
-    if selected_book:
-        # Filter the sales data for the selected book
-        filtered_sales = df_merged[df_merged['Title'] == selected_book]
-        # Group by quarter to get total sales per quarter
-        filtered_sales = filtered_sales.groupby(['Quarter']).agg({'Total Sales': 'sum'}).reset_index()
+# Function to build the sales trend line chart
+# With a granularity of 'day', 'week' or 'month' it shows the orders per day, week or month between the two dates,
+# read from the daily time series of the snapshot
+@figure_cache.memoize('sales-trend-line-chart')
+def build_sales_trend_chart(snapshot, selected_book, granularity='quarter', start_date=None, end_date=None):
+    sales_cube = snapshot.sales_cube
+    if granularity != 'quarter':
+        # Orders per bucket, two lookups in the cumulative daily orders per bucket
+        orders = snapshot.sales_timeseries.trend(selected_book, start_date, end_date, granularity)
+        fig = px.line(
+            orders,
+            x='Date',  # Start of every day, week or month on x-axis
+            y='Orders',  # Orders in it on y-axis
+            title=f"Orders per {granularity.capitalize()} for {selected_book or 'All Books'}",
+            labels={'Date': granularity.capitalize(), 'Orders': 'Orders'},
+            markers=granularity != 'day'  # Markers only where there are few points
+        )
+    elif selected_book:
+        # Total sales per quarter for the selected book
+        filtered_sales = sales_cube.quarter_trend(selected_book)
 
         # Create a line chart showing the sales trend across the quarters
         fig = px.line(
@@ -372,7 +170,7 @@ def update_sales_trend_chart(selected_book):
         )
     else:
         # If no book is selected, show the sales trend across all books for each quarter
-        sales_by_quarter = df_merged.groupby(['Quarter']).agg({'Total Sales': 'sum'}).reset_index()
+        sales_by_quarter = sales_cube.quarter_trend()
 
         # Create a line chart showing total sales per quarter across all books
         fig = px.line(
@@ -387,17 +185,13 @@ def update_sales_trend_chart(selected_book):
     fig.update_layout(xaxis_tickangle=0)
     return fig
 
-# Callback to display Top 10 Selling Books
-@app.callback(
-    Output('top-10-books-bar-chart', 'figure'),
-    Input('book-dropdown', 'value')
-)
-def update_top_10_books_chart(selected_book):
-    # Sort the books by Total Sales in descending order and get the top 10
-    top_10_books = book_sales.sort_values(by='Total Sales', ascending=False).head(10)
-
+# Function to build the Top 10 Selling Books chart (it does not depend on the selection)
+@figure_cache.memoize('top-10-books-bar-chart')
+def build_top_10_books_chart(snapshot):
+    sales_cube = snapshot.sales_cube
+    # The top 10 books by Total Sales, precomputed in the cube
     # Add a 'Rank' column with 1 for the highest sales
-    top_10_books['Rank'] = range(len(top_10_books), 0, -1)
+    top_10_books = sales_cube.top_sales.assign(Rank=range(len(sales_cube.top_sales), 0, -1))
 
     # Create a bar chart showing the rank of books by their total sales
     fig = px.bar(
@@ -425,19 +219,462 @@ def update_top_10_books_chart(selected_book):
     )
     return fig
 
-# Callback to update the Author Name
-@app.callback(
-    Output('author-name', 'children'),
-    Input('book-dropdown', 'value')
-)
-def update_author_name(selected_book):
-    if selected_book:
-        # Get the Author Name for the selected book
-        author_first_name = df_merged.loc[df_merged['Title'] == selected_book, 'First Name'].values[0]
-        author_last_name = df_merged.loc[df_merged['Title'] == selected_book, 'Last Name'].values[0]
-        return f'{author_first_name} {author_last_name}'
-    return "No book selected."
+
+# Function to build the header shown at the top of the page (also while the data is still loading)
+def header_row():
+    return dbc.Row([
+        dbc.Col([
+            html.H1("📚 Bookshop Dashboard", style={
+                'textAlign': 'center',
+                'fontSize': '48px',
+                'marginBottom': '10px'
+            }),
+            html.H5("Visualizing book sales and trends interactively", style={
+                'textAlign': 'center',
+                'color': '#5D4037',
+                'fontStyle': 'italic'
+            })
+        ])
+    ], style={'marginBottom': '30px'})
+
+
+# Function to build the dashboard itself from a data snapshot
+def dashboard_content(snapshot):
+    book_sales = snapshot.sales_cube.book_sales
+
+    # Only the best-selling books are in the page; other books are found by typing (see search_books below), so the
+    # page stays the same size however many titles there are
+    top_titles = snapshot.title_search.search("")
+    books_options = snapshot.title_search.options(top_titles)
+
+    return [
+        # Statistics Cards
+        dbc.Row([
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardBody([
+                        html.H5("Total Sales", className="card-title", style={'textAlign': 'center'}),
+                        html.P(f"{book_sales['Total Sales'].sum()} books sold", className="card-text",
+                               style={'textAlign': 'center', 'fontSize': '20px'}),
+                        html.I(className="bi bi-graph-up-arrow",
+                               style={'fontSize': '40px', 'color': '#FFD700', 'textAlign': 'center'})
+                    ])
+                ], color="primary", inverse=True, style={'margin': '10px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.2)'})
+            ], width=4),
+
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardBody([
+                        html.H5("Total Books", className="card-title", style={'textAlign': 'center'}),
+                        html.P(f"{len(book_sales)} unique titles", className="card-text",
+                               style={'textAlign': 'center', 'fontSize': '20px'}),
+                        html.I(className="bi bi-book-fill",
+                               style={'fontSize': '40px', 'color': '#FFD700', 'textAlign': 'center'})
+                    ])
+                ], color="success", inverse=True, style={'margin': '10px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.2)'})
+            ], width=4),
+
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardBody([
+                        html.H5("Top Genre", className="card-title", style={'textAlign': 'center'}),
+                        html.P("Sci-Fi/Fantasy", className="card-text", style={'textAlign': 'center', 'fontSize': '20px'}),
+                        html.I(className="bi bi-star-fill",
+                               style={'fontSize': '40px', 'color': '#FFD700', 'textAlign': 'center'})
+                    ])
+                ], color="info", inverse=True, style={'margin': '10px', 'boxShadow': '0 4px 8px rgba(0,0,0,0.2)'})
+            ], width=4)
+        ]),
+
+        # Layout - Book Selection and Author Name Section
+        dbc.Row([  # A Bootstrap row containing the dropdown and author name
+            # Select Book Dropdown
+            dbc.Col([  # First column for the dropdown
+                html.H3("Book Name", style={  # Label for the dropdown
+                    'textAlign': 'center',  # Center-aligned text
+                    'marginBottom': '15px',  # Space below the label
+                    'marginTop': '20px',  # Space below the label
+                    'fontSize': '20px',  # Font size
+                    'color': 'black',  # White text for visibility
+                    'fontWeight': 'bold',  # Bold font
+                    'fontFamily': 'Arial, sans-serif'  # Font style
+                }),
+                dcc.Dropdown(  # Dropdown for selecting a book
+                    id='book-dropdown',  # Unique ID for callback functionality
+                    options=books_options,  # Options for the dropdown, replaced by the matches of what is typed
+                    placeholder="Type a title, author or ISBN",  # Placeholder text
+                    search_order='original',  # Keep the matches in the server's order (best selling first)
+                    style={  # Styling for the dropdown
+                        'width': '100%',  # Full width
+                        'fontSize': '15px',  # Font size
+                        'padding': '15px',  # Padding inside the dropdown
+                        'borderRadius': '8px',  # Rounded corners
+                        'border': '1px solid #BDC3C7',  # Light border
+                        'backgroundColor': '#ECF0F1',  # Light gray background
+                        'color': 'black',  # Black text color
+                        'textAlign': 'center',  # Center-aligned placeholder
+                    }
+                ),
+            ], width=6, style={'paddingLeft': '30px'}),  # Column width and left padding
+
+            # Layout- Author Name Box
+            dbc.Col([  # Second column for the author name card
+                html.H3("Author Name", style={  # Label for the author name
+                    'textAlign': 'center',  # Center-aligned text
+                    'marginBottom': '15px',  # Space below the label
+                    'marginTop': '20px',
+                    'fontWeight': 'bold',
+                    'fontSize': '20px',  # Font size
+                    'color': 'black',  # White text for visibility
+                    'fontFamily': 'Arial, sans-serif'  # Font style
+                }),
+                dbc.Card(  # Card to display the author name
+                    dbc.CardBody([
+                        html.Div(id='author-name', style={  # Placeholder for dynamic author name
+                            'fontSize': '24px',  # Font size
+                            'fontWeight': 'bold',  # Bold font
+                            'padding': '15px',  # Padding inside the card
+                            'border': '1px solid #BDC3C7',  # Border around the text
+                            'borderRadius': '8px',  # Rounded corners
+                            'backgroundColor': '#ECF0F1',  # Light background color
+                            'textAlign': 'center',  # Center-aligned text
+                            'color': 'black'  # Black text color
+                        })
+                    ]),
+                    style={  # Styling for the card
+                        'borderRadius': '8px',  # Rounded corners for the card
+                        'backgroundColor': '#fff'  # White background for contrast
+                    }
+                )
+            ], width=5, style={'paddingLeft': '30px'}),  # Column width and left padding
+        ], style={'marginBottom': '20px'}),  # Space between this row and the next
+
+        # Layout- Book Output Row
+        dbc.Row([  # Row to display additional book-related information
+            dbc.Col(html.Div(id='book-output'), width=6, style={'padding': '10px'})
+        ], style={'marginBottom': '20px'}),
+
+        # Sales and Review Charts Row
+        dbc.Row([  # Row for sales and review charts
+            dbc.Col([  # First column for the sales bar chart
+                dcc.Graph(
+                    id='sales-bar-chart',  # Unique ID for callback functionality
+                    config={'displayModeBar': False},  # Hide extra toolbar
+                    style={  # Styling for the chart
+                        'height': '800px',  # Height for larger charts
+                        'padding': '20px'  # Uniform padding
+                    }
+                )
+            ], width=6, style={'padding': '10px'}),  # Column width and padding
+            dbc.Col([  # Second column for the review bar chart
+                dcc.Graph(
+                    id='review-bar-chart',  # Unique ID for callback functionality
+                    config={'displayModeBar': False},  # Hide extra toolbar
+                    style={  # Styling for the chart
+                        'height': '800px',  # Height for larger charts
+                        'padding': '20px'  # Uniform padding
+                    }
+                )
+            ], width=6, style={'padding': '10px'})  # Column width and padding
+        ], style={'marginBottom': '20px'}),
+
+        # Layout - Sales Trend Line Chart Row
+        dbc.Row([  # Row for the sales trend and top 10 books charts
+            dbc.Col([  # First column for the sales trend line chart
+                dbc.Row([  # Controls of the trend chart
+                    dbc.Col(dcc.RadioItems(
+                        id='trend-granularity',  # Quarters as in the Sales sheets, or days, weeks or months
+                        options=[
+                            {'label': 'Quarter', 'value': 'quarter'},
+                            {'label': 'Month', 'value': 'month'},
+                            {'label': 'Week', 'value': 'week'},
+                            {'label': 'Day', 'value': 'day'},
+                        ],
+                        value='quarter',
+                        inline=True,
+                        inputStyle={'marginLeft': '15px', 'marginRight': '5px'}  # Space between the options
+                    ), width=6),
+                    dbc.Col(dcc.DatePickerRange(
+                        id='trend-date-range',  # Dates shown by the day, week and month trends
+                        min_date_allowed=str(snapshot.sales_timeseries.first_day),
+                        max_date_allowed=str(snapshot.sales_timeseries.last_day),
+                        start_date=str(snapshot.sales_timeseries.first_day),
+                        end_date=str(snapshot.sales_timeseries.last_day),
+                        disabled=True  # Enabled when a granularity other than Quarter is picked
+                    ), width=6),
+                ], style={'padding': '0 20px'}),
+                dcc.Graph(
+                    id='sales-trend-line-chart',  # Unique ID for callback functionality
+                    config={'displayModeBar': False},  # Hide extra toolbar
+                    style={  # Styling for the chart
+                        'height': '800px',  # Height for larger charts
+                        'padding': '20px'  # Uniform padding
+                    }
+                )
+            ], width=6, style={'padding': '20px'}),  # Column width and padding
+
+            # Layout - Top 10 Selling Books Chart
+            dbc.Col([  # Second column for the top 10 selling books bar chart
+                html.H3(style={  # Placeholder for any additional heading
+                    'textAlign': 'center',  # Center-aligned text
+                    'marginBottom': '20px',  # Space below the heading
+                    'fontSize': '24px',  # Font size
+                    'fontWeight': 'bold',  # Bold font
+                    'color': '#2980B9',  # Blue text color
+                    'fontFamily': 'Arial, sans-serif'  # Font style
+                }),
+                dcc.Graph(
+                    id='top-10-books-bar-chart',  # Unique ID for the chart
+                    figure=build_top_10_books_chart(snapshot),  # Static: the top 10 do not change with the selection
+                    config={'displayModeBar': False},  # Hide extra toolbar
+                    style={  # Styling for the chart
+                        'height': '800px',  # Height for larger charts
+                        'padding': '20px'  # Uniform padding
+                    }
+                )
+            ], width=6, style={'padding': '10px'})  # Column width and padding
+        ], style={'marginBottom': '20px'}),
+
+        # Author name of every book in the dropdown for the clientside lookup
+        dcc.Store(id='author-lookup', data=snapshot.title_search.authors_of(top_titles))
+    ]
+
+
+# Function to build the placeholder shown until the first data snapshot is loaded
+def loading_content(data_store):
+    message = "Loading the bookshop data..."
+    if data_store.error:
+        message = f"Still trying to load the bookshop data ({data_store.error})"
+    return [
+        dbc.Row([
+            dbc.Col([
+                dbc.Spinner(color="primary"),
+                html.P(message, style={'marginTop': '15px', 'fontSize': '20px'}),
+            ], style={'textAlign': 'center', 'padding': '60px'})
+        ])
+    ]
+
+
+# Function to build the layout from the current data snapshot (called on every page load, so refreshed data shows up)
+# Until the first snapshot is loaded the page shows a placeholder and polls until the dashboard can be filled in
+def serve_layout(data_store):
+    snapshot = data_store.snapshot
+    return html.Div([
+        header_row(),
+        html.Div(id='dashboard-content',
+                 children=dashboard_content(snapshot) if snapshot else loading_content(data_store)),
+        dcc.Interval(id='data-ready-poll', interval=1000, disabled=snapshot is not None)
+    ], style={'backgroundColor': '#EAF6F6', 'color': '#084C61'})  # Overall dashboard background and text color
+
+
+# Function to add health check routes to the Flask server behind the app
+#   /healthz - the process is up and answering (even while the data is still loading)
+#   /readyz  - the first data snapshot is loaded; 503 until then
+def add_health_routes(server, data_store):
+    def healthz():
+        return "ok", 200, {'Content-Type': 'text/plain'}
+
+    def readyz():
+        snapshot = data_store.snapshot
+        if snapshot is None:
+            body = {'ready': False, 'error': data_store.error}
+            return json.dumps(body), 503, {'Content-Type': 'application/json'}
+        return json.dumps({'ready': True, 'version': snapshot.version}), 200, {'Content-Type': 'application/json'}
+
+    server.add_url_rule("/healthz", "healthz", healthz)
+    server.add_url_rule("/readyz", "readyz", readyz)
+
+
+# Function to gzip the JSON and HTML responses (layout, callback results) for browsers that accept it
+# Figures repeat the same template and labels, so they shrink several times; the JavaScript bundles are left alone,
+# the browser caches those
+def add_response_compression(server, min_bytes=1024, level=6):
+    def compress(response):
+        if (response.status_code != 200 or response.direct_passthrough or 'Content-Encoding' in response.headers
+                or response.mimetype not in ('application/json', 'text/html')
+                or 'gzip' not in request.headers.get('Accept-Encoding', '')):
+            return response
+        data = response.get_data()
+        if len(data) < min_bytes:
+            return response
+        with metrics.stage('gzip_response'):
+            response.set_data(gzip.compress(data, compresslevel=level))
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    server.after_request(compress)
+
+
+# App factory: builds the Dash app around a snapshot store
+# If none is given the data is loaded in the background, so the server answers at once with a loading page
+# For example: gunicorn "code_final:create_app().server"
+def create_app(data_store=None):
+    if data_store is None:
+        data_store = load_data_store(background=True)
+    data_store.listeners.append(lambda snapshot: figure_cache.invalidate())
+
+    # Initialize the Dash app and set up the layout
+    # The dashboard components only appear once the data is loaded, so callbacks may target ids that are not on the
+    # page yet
+    app = dash.Dash(__name__, external_stylesheets=[dbc.themes.CERULEAN], suppress_callback_exceptions=True)
+    app.layout = lambda: serve_layout(data_store)
+    add_health_routes(app.server, data_store)
+    add_response_compression(app.server)
+
+    # Stage timings and callback latencies on /metrics (see metrics.py)
+    add_metrics_route(app.server)
+    metrics.add_gauge('bookshop_snapshot_version', "Version of the data snapshot being served (0 while loading)",
+                      lambda: data_store.snapshot.version if data_store.snapshot else 0)
+    metrics.add_gauge('bookshop_titles', "Number of titles in the data snapshot",
+                      lambda: len(data_store.snapshot.sales_cube.titles) if data_store.snapshot else 0)
+    metrics.add_gauge('bookshop_figure_cache_hits', "Figures served from the figure cache", lambda: figure_cache.hits)
+    metrics.add_gauge('bookshop_figure_cache_misses', "Figures built because they were not cached",
+                      lambda: figure_cache.misses)
+    metrics.add_gauge('bookshop_figure_cache_entries', "Figures in the figure cache", lambda: len(figure_cache.entries))
+
+    # Fill in the dashboard once the first data snapshot is loaded (the page polls until then)
+    @app.callback(
+        Output('dashboard-content', 'children'),
+        Output('data-ready-poll', 'disabled'),
+        Input('data-ready-poll', 'n_intervals'),
+        prevent_initial_call=True
+    )
+    def fill_dashboard(n_intervals):
+        snapshot = data_store.snapshot
+        if snapshot is None:
+            return loading_content(data_store), False
+        return dashboard_content(snapshot), True
+
+    # Search as you type: the dropdown gets the best-selling matches of the typed title, author or ISBN words,
+    # together with their authors for the author lookup; the selected book stays in the options
+    @app.callback(
+        Output('book-dropdown', 'options'),
+        Output('author-lookup', 'data'),
+        Input('book-dropdown', 'search_value'),
+        State('book-dropdown', 'value'),
+        prevent_initial_call=True
+    )
+    @metrics.trace_callback('search_books')
+    def search_books(search_value, selected_book):
+        title_search = data_store.snapshot.title_search
+        titles = title_search.search(search_value)
+        if selected_book and selected_book not in titles:
+            titles = [selected_book] + titles
+        return title_search.options(titles), title_search.authors_of(titles)
+
+    # This section handles the callback logic to update the dashboard based on the dropdown selection
+    # One callback updates every chart that depends on the selection, so a selection costs a single request
+    @app.callback(
+        Output('sales-bar-chart', 'figure'),
+        Output('review-bar-chart', 'figure'),
+        Output('sales-trend-line-chart', 'figure'),
+        Input('book-dropdown', 'value'),
+        Input('trend-granularity', 'value'),
+        Input('trend-date-range', 'start_date'),
+        Input('trend-date-range', 'end_date')
+    )
+    @metrics.trace_callback('update_book_charts')
+    def update_book_charts(selected_book, granularity, start_date, end_date):
+        snapshot = data_store.snapshot  # The same snapshot for all three charts, even if a refresh swaps it meanwhile
+        if granularity == 'quarter':
+            start_date = end_date = None  # The quarter trend covers the whole year, so it is cached only once
+        return (
+            build_sales_chart(snapshot, selected_book),
+            build_review_chart(snapshot, selected_book),
+            build_sales_trend_chart(snapshot, selected_book, granularity, start_date, end_date),
+        )
+
+    # The date range only applies to the day, week and month trends
+    app.clientside_callback(
+        """
+        function(granularity) {
+            return granularity === "quarter";
+        }
+        """,
+        Output('trend-date-range', 'disabled'),
+        Input('trend-granularity', 'value')
+    )
+
+    # Callback to update the Author Name, run in the browser from the author lookup table
+    app.clientside_callback(
+        """
+        function(selectedBook, authorsByTitle) {
+            if (!selectedBook) {
+                return "No book selected.";
+            }
+            return authorsByTitle[selectedBook] || "Unknown book.";
+        }
+        """,
+        Output('author-name', 'children'),
+        Input('book-dropdown', 'value'),
+        State('author-lookup', 'data')
+    )
+
+    return app
+
+
+# Function to read the command line options
+def parse_args():
+    parser = argparse.ArgumentParser(description="Bookshop Dashboard")
+    parser.add_argument('--offline', action='store_true', default=os.getenv("SHEETS_OFFLINE", "0") == "1",
+                        help="Load the sheets only from the on-disk cache, never from the API")
+    parser.add_argument('--serve', action='store_true',
+                        help="Production mode: load the data once and serve it from several worker processes")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Number of worker processes in production mode")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8056)
+    parser.add_argument('--snapshot-dir', default=os.getenv("SNAPSHOT_DIR", ".snapshots"),
+                        help="Where production mode writes the snapshot files shared with the workers")
+    parser.add_argument('--lazy', action='store_true', default=os.getenv("LAZY_STARTUP", "0") == "1",
+                        help="Start serving at once with a loading page and load the data in the background")
+    parser.add_argument('--snapshot-writer', action='store_true', help=argparse.SUPPRESS)  # Loader of --serve --lazy
+    parser.add_argument('--profile-callback', metavar='NAME',
+                        help="Profile the next call of this callback (e.g. update_book_charts) with cProfile "
+                             "and write the capture to PROFILE_DIR (default .profiles)")
+    return parser.parse_args()
+
+
+# Function to write the data for the production workers to memory-map, and again whenever the refresher swaps in
+# new data
+def write_snapshots(data_store, snapshot_dir):
+    write_snapshot(data_store.snapshot, snapshot_dir)
+    data_store.listeners.append(lambda snapshot: write_snapshot(snapshot, snapshot_dir))
+
+
+# Function run by the loader process of `--serve --lazy`: load the data, write the snapshot files and keep them
+# fresh until the server process that started it goes away
+def run_snapshot_writer(offline, snapshot_dir):
+    server_pid = os.getppid()
+    data_store = load_data_store(offline=offline, background=True)  # The first load is retried until it succeeds
+    data_store.listeners.append(lambda snapshot: write_snapshot(snapshot, snapshot_dir))
+    if data_store.snapshot is not None:
+        write_snapshot(data_store.snapshot, snapshot_dir)  # Loaded before the listener was added
+    while os.getppid() == server_pid:
+        if data_store.snapshot is not None and not (data_store.refresher and data_store.refresher.is_alive()):
+            break  # Loaded, and nothing left to keep fresh
+        time.sleep(1)
+
 
 # Run the dashboard
 if __name__ == '__main__':
-    app.run_server(debug=True, port=8056)
\ No newline at end of file
+    args = parse_args()
+    # Callback spans and profiles are logged at INFO, pipeline stages at DEBUG
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(name)s %(message)s")
+    if args.profile_callback:
+        metrics.profile_next(args.profile_callback)
+    if args.snapshot_writer:
+        run_snapshot_writer(args.offline, args.snapshot_dir)
+    elif args.serve:
+        if args.lazy:
+            # Load in a separate process, so gunicorn can bind and fork its workers right away; the workers show the
+            # loading page until the first snapshot files are written
+            subprocess.Popen([sys.executable, os.path.abspath(__file__), '--snapshot-writer',
+                              '--snapshot-dir', args.snapshot_dir] + (['--offline'] if args.offline else []))
+        else:
+            write_snapshots(load_data_store(offline=args.offline), args.snapshot_dir)
+        run_production_server(create_app, args.snapshot_dir, args.workers, args.host, args.port)
+    else:
+        data_store = load_data_store(offline=args.offline, background=args.lazy)
+        create_app(data_store).run(debug=True, host=args.host, port=args.port)
@@ -0,0 +1,140 @@
+# Background refresh of the bookshop data while the dashboard keeps serving
+# A refresher thread polls the sheets, works out what changed and swaps a new DataSnapshot into the store
+import threading
+import time
+
+from sheets_loader import SHEET_RANGES, fetch_all_frames, make_session, stream_sheet_frame
+from sheet_cache import SheetCache, frame_content_hash
+from sheet_decoder import using_decode_processes
+from bookshop_data import (DIMENSION_RANGES, SALES_QUARTERS, apply_sales_delta, build_snapshot, load_sheet_frames,
+                           make_schema_converters)
+
+
+class SnapshotStore:
+    # Holds the current DataSnapshot. Readers take `store.snapshot` once and use that object for the whole request;
+    # swap() replaces the reference in one assignment, so nobody ever sees a half-updated snapshot
+    # The snapshot is None until the first one is loaded (see BackgroundLoader)
+    def __init__(self, snapshot=None):
+        self.snapshot = snapshot
+        self.listeners = []  # Called with the new snapshot after every swap (e.g. to clear the figure cache)
+        self.error = None  # Why the first load has not succeeded yet, if it failed
+        self.refresher = None  # The DataRefresher keeping this store fresh, if one was started
+
+    def swap(self, snapshot):
+        self.snapshot = snapshot
+        for listener in self.listeners:
+            listener(snapshot)
+
+
+class BackgroundLoader(threading.Thread):
+    # Builds the first snapshot in the background, so the server can answer (with a loading page) right away
+    # `load` returns a DataSnapshot; if it raises, it is retried every `retry_interval` seconds
+    # `on_loaded` is called with the snapshot once it has been swapped in (e.g. to start the refresher)
+    def __init__(self, store, load, retry_interval=30, on_loaded=None):
+        super().__init__(name="data-loader", daemon=True)
+        self.store = store
+        self.load = load
+        self.retry_interval = retry_interval
+        self.on_loaded = on_loaded
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            start = time.perf_counter()
+            try:
+                snapshot = self.load()
+            except Exception as error:
+                self.store.error = f"{type(error).__name__}: {error}"
+                print(f"Loading the data failed ({self.store.error}), retrying in {self.retry_interval}s")
+                self.stop_event.wait(self.retry_interval)
+                continue
+            self.store.error = None
+            self.store.swap(snapshot)
+            print(f"Data loaded in the background in {time.perf_counter() - start:.2f}s")
+            if self.on_loaded:
+                self.on_loaded(snapshot)
+            return
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class DataRefresher(threading.Thread):
+    # Polls the sheets every `interval` seconds:
+    #   - the small Book, Edition and Author sheets are refetched; if any changed the data is fully reloaded
+    #   - otherwise only the rows appended to each Sales sheet are read and added to the aggregates
+    #   - every `full_every` polls everything is reloaded, to pick up edits to existing Sales rows
+    def __init__(self, store, api_key, cache, interval=300, full_every=12, session=None):
+        super().__init__(name="data-refresher", daemon=True)
+        self.store = store
+        self.api_key = api_key
+        self.cache = cache
+        self.interval = interval
+        self.full_every = full_every
+        self.session = session or make_session()
+        self.stop_event = threading.Event()
+        self.polls = 0
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.refresh_once()
+            except Exception as error:  # Keep serving the current snapshot if a refresh goes wrong
+                print(f"Data refresh failed: {error}")
+
+    def stop(self):
+        self.stop_event.set()
+
+    # Run one poll; returns True if a new snapshot was swapped in
+    def refresh_once(self):
+        self.polls += 1
+        start = time.perf_counter()
+        snapshot = self.store.snapshot
+        if self.polls % self.full_every == 0:
+            return self.full_reload(snapshot, start)
+
+        # Dimension sheets: compare content hashes with the ones the snapshot was built from
+        dimension_ranges = {name: SHEET_RANGES[name] for name in DIMENSION_RANGES}
+        frames, _ = fetch_all_frames(dimension_ranges, self.api_key, session=self.session,
+                                     converters=make_schema_converters())
+        if any(df is None for df in frames.values()):
+            print("Data refresh: could not fetch the Book/Edition/Author sheets, keeping the current data")
+            return False
+        changed = [name for name, df in frames.items() if frame_content_hash(df) != snapshot.range_hashes[name]]
+        if changed:
+            print(f"Data refresh: {', '.join(changed)} changed, reloading everything")
+            return self.full_reload(snapshot, start)
+
+        # Sales sheets: read only the rows after the last one already loaded (row 1 is the header)
+        converters = make_schema_converters()
+        deltas = {}
+        with using_decode_processes():
+            for name in SALES_QUARTERS:
+                df = stream_sheet_frame(self.session, SHEET_RANGES[name], self.api_key, convert=converters[name],
+                                        first_row=snapshot.sheet_rows[name] + 2, header=snapshot.sales_headers[name])
+                if df is None:
+                    print(f"Data refresh: could not fetch new rows of {name}, keeping the current data")
+                    return False
+                if df.attrs['sheet_rows']:
+                    deltas[name] = df
+        if not deltas:
+            return False
+
+        new_snapshot = apply_sales_delta(snapshot, deltas)
+        self.store.swap(new_snapshot)
+        added = ", ".join(f"{name}: +{df.attrs['sheet_rows']}" for name, df in deltas.items())
+        print(f"Data refresh: appended sales rows ({added}) in {time.perf_counter() - start:.2f}s, "
+              f"now version {new_snapshot.version}")
+        return True
+
+    # Refetch every range (bypassing the cache TTL) and swap in a new snapshot if anything differs
+    def full_reload(self, snapshot, start):
+        fresh_cache = SheetCache(self.cache.cache_dir, ttl=0, spreadsheet_id=self.cache.spreadsheet_id)
+        frames = load_sheet_frames(self.api_key, fresh_cache, session=self.session)
+        if all(frame_content_hash(df) == snapshot.range_hashes.get(name) for name, df in frames.items()):
+            return False
+        new_snapshot = build_snapshot(frames, version=snapshot.version + 1)
+        self.store.swap(new_snapshot)
+        print(f"Data refresh: reloaded all sheets in {time.perf_counter() - start:.2f}s, "
+              f"now version {new_snapshot.version}")
+        return True
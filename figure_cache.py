@@ -0,0 +1,66 @@
+# Memoized figures for the dashboard callbacks
+# Figures are keyed by callback, selected book and data version, serialized to plain JSON once (with compact trace
+# data, see figure_encoding.py) and evicted least-recently-used first when the cache is full
+import functools
+import json
+import threading
+from collections import OrderedDict
+
+from figure_encoding import compact_figure, date_arrays
+from metrics import metrics
+
+
+class FigureCache:
+    def __init__(self, max_entries=256, max_points=None):
+        self.max_entries = max_entries
+        self.max_points = max_points  # Line traces are downsampled to this many points (None: keep them all)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()  # Callbacks run concurrently in a threaded server
+        self.version = 0  # Data version; bumped by invalidate() whenever the data is refreshed
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            figure = self.entries.get(key)
+            if figure is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)  # Mark as most recently used
+            self.hits += 1
+            return figure
+
+    def put(self, key, figure):
+        with self.lock:
+            if key[1] != self.version:
+                return  # Built from data that has been replaced in the meantime
+            self.entries[key] = figure
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)  # Evict the least recently used figure
+
+    # Drop every cached figure; call this after the data is refreshed
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+            self.version += 1
+
+    # Decorator caching the figure returned by a callback
+    def memoize(self, name):
+        def decorator(callback):
+            @functools.wraps(callback)
+            def wrapper(*args):
+                key = (name, self.version, args)
+                figure = self.get(key)
+                if figure is None:
+                    with metrics.stage('figure_build:' + name):
+                        figure = callback(*args)
+                    if hasattr(figure, 'to_json'):
+                        with metrics.stage('figure_serialize:' + name):
+                            dates = date_arrays(figure)
+                            figure = json.loads(figure.to_json())  # Serialize the Plotly figure once
+                            figure = compact_figure(figure, self.max_points, dates)
+                    self.put(key, figure)
+                return figure
+            return wrapper
+        return decorator
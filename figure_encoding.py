@@ -0,0 +1,150 @@
+# Compact encoding of the serialized dashboard figures
+# Plotly.js reads numeric trace data as typed arrays ({'dtype': 'f8', 'bdata': <base64>}), which is smaller to send
+# and much faster for the browser to parse than JSON lists of numbers. Plotly.py already encodes most numpy arrays
+# this way, but falls back to lists for integers beyond 32 bits and sends dates as ISO strings; this module encodes
+# those too, and thins out line traces with more points than the plot has pixels across (LTTB)
+import base64
+import re
+
+import numpy as np
+
+# Type codes of plotly.js typed arrays
+TYPED_ARRAY_DTYPES = {'i1': np.int8, 'u1': np.uint8, 'i2': np.int16, 'u2': np.uint16, 'i4': np.int32,
+                      'u4': np.uint32, 'f4': np.float32, 'f8': np.float64}
+
+# Integer types tried, smallest first, for integer data
+INTEGER_TYPE_CODES = ['i1', 'u1', 'i2', 'u2', 'i4', 'u4']
+
+# Dates as Plotly serializes them ('2022-01-31' or '2022-01-31T00:00:00')
+ISO_DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}(T\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?")
+
+# Trace attributes holding one value per point
+POINT_ATTRIBUTES = ['x', 'y', 'customdata', 'text', 'hovertext']
+
+
+# Function to turn a trace attribute (a typed array spec or a list) into a numpy array, or None if it is neither
+# Lists of date strings only become dates with `dates=True`: text that looks like a date may just be a category
+def decode_array(value, dates=False):
+    if isinstance(value, dict) and 'bdata' in value:
+        array = np.frombuffer(base64.b64decode(value['bdata']), dtype=TYPED_ARRAY_DTYPES[value['dtype']])
+        if 'shape' in value:
+            array = array.reshape([int(size) for size in str(value['shape']).split(",")])
+        return array
+    if isinstance(value, list):
+        if dates and value and all(isinstance(item, str) and ISO_DATE_PATTERN.fullmatch(item) for item in value):
+            return np.array(value, dtype='datetime64[ms]')
+        try:
+            return np.array(value)
+        except ValueError:
+            return None  # Ragged nested lists
+    return None
+
+
+# Function to build the typed array spec of a numeric array, in the smallest type that holds it exactly
+def encode_array(array):
+    if array.dtype.kind in 'iu' and array.size:
+        low, high = array.min(), array.max()
+        for code in INTEGER_TYPE_CODES:
+            info = np.iinfo(TYPED_ARRAY_DTYPES[code])
+            if info.min <= low and high <= info.max:
+                array = array.astype(TYPED_ARRAY_DTYPES[code])
+                break
+        else:
+            array = array.astype(np.float64)  # Exact up to 2**53
+    elif array.dtype.kind == 'f':
+        array = array.astype(np.float64)
+    else:
+        return None
+    codes = {np.dtype(dtype): code for code, dtype in TYPED_ARRAY_DTYPES.items()}
+    spec = {'dtype': codes[array.dtype], 'bdata': base64.b64encode(np.ascontiguousarray(array)).decode('ascii')}
+    if array.ndim > 1:
+        spec['shape'] = ", ".join(str(size) for size in array.shape)
+    return spec
+
+
+# Function to find which x and y arrays of a Plotly figure hold dates, before it is serialized (which turns them
+# into strings); returns a set of (trace number, attribute name)
+def date_arrays(figure):
+    found = set()
+    for number, trace in enumerate(figure.data):
+        for name in ('x', 'y'):
+            values = trace[name] if name in trace else None
+            if getattr(values, 'dtype', None) is not None and values.dtype.kind == 'M':
+                found.add((number, name))
+    return found
+
+
+# Function to get the layout key of the axis a serialized trace's x or y values go on ('x2' -> 'xaxis2')
+def axis_key(trace, name):
+    return name + 'axis' + trace.get(name + 'axis', name)[1:]
+
+
+# Function to check whether the axis a trace's x or y values go on is declared as a date axis in the layout
+def is_date_axis(figure, trace, name):
+    return (figure.get('layout', {}).get(axis_key(trace, name)) or {}).get('type') == 'date'
+
+
+# Function to pick which of the points (x, y) to keep to draw the line with `n_out` points, Largest-Triangle-Three-
+# Buckets: the first and last points, and from every bucket in between the point making the largest triangle with
+# the point kept before it and the average of the next bucket. Returns the positions of the kept points
+def lttb(x, y, n_out):
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)  # n_out - 2 buckets between the first and last point
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_stop = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x, next_y = x[stop:next_stop].mean(), y[stop:next_stop].mean()
+        areas = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                       - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+    return kept
+
+
+# Function to downsample the line traces of a serialized figure to at most `max_points` points each (the plot width
+# in pixels: more points than that cannot be told apart) and send every numeric per-point array as a typed array
+# Works in place on the dict from figure.to_json() and returns it; x and y values are sent as dates only if they are
+# listed in `dates` (see date_arrays) or their axis is a date axis
+def compact_figure(figure, max_points=None, dates=()):
+    for number, trace in enumerate(figure.get('data', [])):
+        arrays = {}
+        for name in POINT_ATTRIBUTES:
+            if name in trace:
+                is_date = name in ('x', 'y') and ((number, name) in dates or is_date_axis(figure, trace, name))
+                arrays[name] = decode_array(trace[name], is_date)
+        marker = trace.get('marker') or {}
+        if 'color' in marker:
+            arrays['marker.color'] = decode_array(marker['color'])
+        arrays = {name: array for name, array in arrays.items() if array is not None}
+
+        x, y = arrays.get('x'), arrays.get('y')
+        is_line = trace.get('type', 'scatter') in ('scatter', 'scattergl') and 'lines' in trace.get('mode', 'lines')
+        downsampled = False
+        if (max_points and is_line and x is not None and y is not None and len(x) == len(y) > max_points
+                and x.dtype.kind in 'iufM' and y.dtype.kind in 'iuf'):
+            kept = lttb(x.astype(np.float64), y, max_points)
+            arrays = {name: array[kept] if len(array) == len(x) else array for name, array in arrays.items()}
+            downsampled = True
+
+        for name, array in arrays.items():
+            if array.dtype.kind == 'M' and name in ('x', 'y'):
+                # Dates go as milliseconds since 1970, so the axis has to be told they are dates
+                array = array.astype('datetime64[ms]').astype(np.int64).astype(np.float64)
+                figure.setdefault('layout', {}).setdefault(axis_key(trace, name), {})['type'] = 'date'
+            encoded = encode_array(array)
+            if encoded is None:
+                if not downsampled:
+                    continue  # Text and mixed values stay as they are
+                encoded = array.astype(str).tolist() if array.dtype.kind == 'M' else array.tolist()
+            if name == 'marker.color':
+                trace['marker']['color'] = encoded
+            else:
+                trace[name] = encoded
+    return figure
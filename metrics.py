@@ -0,0 +1,191 @@
+# Timing instrumentation for the data pipeline and the dashboard callbacks
+# Every stage (HTTP fetch, JSON parsing, schema conversion, merge, aggregation, figure building, ...) records its
+# time, row count and the change in process memory; callbacks also log one span line per call.
+# The numbers are served in the Prometheus text format on /metrics (per process: every gunicorn worker has its own)
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("bookshop.metrics")
+
+# Upper bounds (seconds) of the callback latency histogram buckets
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+# Callback to profile once with cProfile (see Metrics.profile_next), and where the capture is written
+PROFILE_CALLBACK = os.getenv("PROFILE_CALLBACK")
+PROFILE_DIR = os.getenv("PROFILE_DIR", ".profiles")
+
+
+# Function to read the resident memory of this process in bytes (None where /proc is not available)
+def resident_memory_bytes():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StageSpan:
+    # One timed run of a stage; the code inside the `with` block can set the number of rows it produced
+    def __init__(self, name):
+        self.name = name
+        self.rows = None
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()  # Stages run in the fetch threads and in concurrent callbacks
+        self.stages = {}  # Stage name -> calls, seconds, rows and memory of its runs
+        self.callbacks = {}  # Callback name -> latency histogram
+        self.gauges = {}  # Metric name -> (help text, function returning the current value)
+        self.profile_callbacks = {PROFILE_CALLBACK} if PROFILE_CALLBACK else set()
+
+    # Context manager timing one run of a stage:
+    #     with metrics.stage('merge') as span:
+    #         df = ...
+    #         span.rows = len(df)
+    # The memory delta is the change in resident memory of the whole process, so it is only exact for stages
+    # that do not overlap with other work
+    @contextmanager
+    def stage(self, name):
+        span = StageSpan(name)
+        memory_before = resident_memory_bytes()
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            elapsed = time.perf_counter() - start
+            memory_after = resident_memory_bytes()
+            memory_delta = memory_after - memory_before if memory_before is not None and memory_after else 0
+            self.record_stage(name, elapsed, span.rows, memory_delta)
+
+    def record_stage(self, name, seconds, rows=None, memory_delta=0):
+        with self.lock:
+            stats = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'rows': 0, 'last_seconds': 0.0,
+                                                  'last_rows': 0, 'last_memory_delta': 0})
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            stats['last_seconds'] = seconds
+            stats['last_memory_delta'] = memory_delta
+            if rows is not None:
+                stats['rows'] += rows
+                stats['last_rows'] = rows
+        logger.debug("stage %s: %.1f ms, rows=%s, memory %+.1f MB", name, seconds * 1000, rows, memory_delta / 1e6)
+
+    def record_callback(self, name, seconds, failed=False):
+        with self.lock:
+            stats = self.callbacks.setdefault(name, {'buckets': [0] * len(LATENCY_BUCKETS), 'count': 0,
+                                                     'sum': 0.0, 'errors': 0})
+            stats['count'] += 1
+            stats['sum'] += seconds
+            stats['errors'] += failed
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    stats['buckets'][i] += 1
+
+    # Register a value read at scrape time, such as the figure cache hit count
+    def add_gauge(self, name, help_text, function):
+        self.gauges[name] = (help_text, function)
+
+    # Profile the next call of a callback with cProfile
+    def profile_next(self, name):
+        with self.lock:
+            self.profile_callbacks.add(name)
+
+    # Decorator timing every call of a Dash callback, logging a span line and profiling it once if asked to
+    def trace_callback(self, name):
+        def decorator(callback):
+            @functools.wraps(callback)
+            def wrapper(*args, **kwargs):
+                with self.lock:
+                    profile = name in self.profile_callbacks
+                    self.profile_callbacks.discard(name)
+                profiler = cProfile.Profile() if profile else None
+                failed = True
+                start = time.perf_counter()
+                try:
+                    if profiler:
+                        result = profiler.runcall(callback, *args, **kwargs)
+                    else:
+                        result = callback(*args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    elapsed = time.perf_counter() - start
+                    self.record_callback(name, elapsed, failed)
+                    logger.info("callback %s%r took %.1f ms%s", name, args, elapsed * 1000,
+                                " (failed)" if failed else "")
+                    if profiler:
+                        self.dump_profile(name, profiler)
+            return wrapper
+        return decorator
+
+    # Write a cProfile capture to PROFILE_DIR (open it with `python -m pstats` or snakeviz) and log the top entries
+    def dump_profile(self, name, profiler):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+        profiler.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(15)
+        logger.info("profile of %s written to %s\n%s", name, path, summary.getvalue())
+
+    # All metrics in the Prometheus text exposition format
+    def render_prometheus(self):
+        lines = []
+
+        def family(name, metric_type, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        with self.lock:
+            stages = {name: dict(stats) for name, stats in self.stages.items()}
+            callbacks = {name: dict(stats, buckets=list(stats['buckets'])) for name, stats in self.callbacks.items()}
+
+        stage_families = [
+            ('bookshop_stage_calls_total', 'counter', "Runs of each pipeline stage", 'calls'),
+            ('bookshop_stage_seconds_total', 'counter', "Seconds spent in each pipeline stage", 'seconds'),
+            ('bookshop_stage_rows_total', 'counter', "Rows produced by each pipeline stage", 'rows'),
+            ('bookshop_stage_last_seconds', 'gauge', "Seconds taken by the last run of each stage", 'last_seconds'),
+            ('bookshop_stage_last_rows', 'gauge', "Rows produced by the last run of each stage", 'last_rows'),
+            ('bookshop_stage_last_memory_delta_bytes', 'gauge',
+             "Change in resident memory during the last run of each stage", 'last_memory_delta'),
+        ]
+        for metric, metric_type, help_text, field in stage_families:
+            family(metric, metric_type, help_text)
+            for name, stats in sorted(stages.items()):
+                lines.append(f'{metric}{{stage="{name}"}} {stats[field]}')
+
+        family('bookshop_callback_duration_seconds', 'histogram', "Latency of the dashboard callbacks")
+        for name, stats in sorted(callbacks.items()):
+            for bound, count in zip(LATENCY_BUCKETS, stats['buckets']):
+                lines.append(f'bookshop_callback_duration_seconds_bucket{{callback="{name}",le="{bound}"}} {count}')
+            lines.append(f'bookshop_callback_duration_seconds_bucket{{callback="{name}",le="+Inf"}} {stats["count"]}')
+            lines.append(f'bookshop_callback_duration_seconds_sum{{callback="{name}"}} {stats["sum"]}')
+            lines.append(f'bookshop_callback_duration_seconds_count{{callback="{name}"}} {stats["count"]}')
+        family('bookshop_callback_errors_total', 'counter', "Dashboard callbacks that raised an exception")
+        for name, stats in sorted(callbacks.items()):
+            lines.append(f'bookshop_callback_errors_total{{callback="{name}"}} {stats["errors"]}')
+
+        family('bookshop_process_resident_memory_bytes', 'gauge', "Resident memory of this process")
+        lines.append(f"bookshop_process_resident_memory_bytes {resident_memory_bytes() or 0}")
+        for name, (help_text, function) in sorted(self.gauges.items()):
+            family(name, 'gauge', help_text)
+            lines.append(f"{name} {function()}")
+        return "\n".join(lines) + "\n"
+
+
+# Metrics of this process, shared by the loader modules and the dashboard
+metrics = Metrics()
+
+
+# Function to add the /metrics route to the Flask server behind a Dash app
+def add_metrics_route(server, registry=metrics):
+    def metrics_view():
+        return registry.render_prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+    server.add_url_rule("/metrics", "metrics", metrics_view)
@@ -0,0 +1,33 @@
+# Multi-process production server for the dashboard
+# The data is loaded once in the main process and shared with the gunicorn workers through snapshot files
+import gc
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # gunicorn is only needed for --serve
+    BaseApplication = None
+
+
+# Function to run `app_factory(data_store)` in `workers` gunicorn worker processes
+# Every worker reads the snapshot files under `snapshot_root` (see snapshot_files.py) instead of loading the data
+def run_production_server(app_factory, snapshot_root, workers, host, port, threads=4):
+    if BaseApplication is None:
+        raise SystemExit("The production server needs gunicorn: pip install gunicorn")
+
+    from snapshot_files import SnapshotFileStore
+
+    class DashboardApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f"{host}:{port}")
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('preload_app', False)  # Each worker maps the snapshot files after it is forked
+
+        def load(self):
+            return app_factory(SnapshotFileStore(snapshot_root)).server
+
+    # Move everything loaded so far out of the garbage collector's reach, so collections in the forked workers
+    # do not touch (and copy) the pages they share with the main process
+    gc.freeze()
+    print(f"Serving on http://{host}:{port} with {workers} workers")
+    DashboardApplication().run()
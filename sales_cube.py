@@ -0,0 +1,134 @@
+# Precomputed Title x Quarter aggregates of the merged sales data
+# Built once when the data is loaded, so the dashboard callbacks answer every selection with dictionary and
+# array lookups instead of scanning df_merged
+import numpy as np
+import pandas as pd
+
+# Counts kept per title and quarter; everything else the dashboard shows is derived from them
+MEASURES = ['rows', 'orders', 'rating_sum', 'rating_count']
+
+# Totals derived from the counts (see cube_totals)
+TOTALS = ['total_sales', 'title_sales', 'title_ratings', 'top_sales', 'top_ratings']
+
+# Columns of the merged sales rows the cube is built from (the join in bookshop_data.py produces only these)
+INPUT_COLUMNS = ['Title', 'Quarter', 'OrderID', 'Rating', 'First Name', 'Last Name']
+
+
+# Function to count the sales rows, orders and ratings of a merged DataFrame per title and quarter
+def count_by_title_and_quarter(df_merged):
+    return df_merged.groupby(['Title', 'Quarter'], observed=True).agg(
+        rows=('Title', 'size'),
+        orders=('OrderID', 'count'),  # Number of orders per title and quarter
+        rating_sum=('Rating', 'sum'),
+        rating_count=('Rating', 'count'),
+    )
+
+
+# Function to get the author of each title from its first sales row, like the original lookup did
+def first_authors(df_merged):
+    first_rows = df_merged.drop_duplicates('Title')
+    return {title: f"{first_name} {last_name}"
+            for title, first_name, last_name in zip(first_rows['Title'], first_rows['First Name'],
+                                                    first_rows['Last Name'])}
+
+
+# Function to derive the totals the dashboard shows from the counts per title and quarter
+def cube_totals(counts):
+    # 'Total Sales' as the charts have always shown it: the per-row count of orders of the title,
+    # summed over the title's rows in each quarter
+    total_sales = counts['rows'] * counts['orders'].sum(axis=1, keepdims=True)
+    title_sales = total_sales.sum(axis=1)
+    title_ratings = counts['rating_sum'].sum(axis=1) / counts['rating_count'].sum(axis=1)
+    return {
+        'total_sales': total_sales,
+        'title_sales': title_sales,
+        'title_ratings': title_ratings,
+        # Rows of the 10 best-selling and best-rated titles
+        'top_sales': pd.Series(title_sales).sort_values(ascending=False).head(10).index.to_numpy(),
+        'top_ratings': pd.Series(title_ratings).sort_values(ascending=False).head(10).index.to_numpy(),
+    }
+
+
+class SalesCube:
+    # Every measure is a (titles x quarters) array; `title_index` maps a title to its row
+    # `totals` are the cube_totals() of the counts when they are already known (read from a snapshot folder)
+    # A cube is never modified after it is built: with_delta() returns a new one
+    def __init__(self, titles, quarters, counts, authors, totals=None):
+        self.titles = titles
+        self.quarters = quarters
+        self.title_index = {title: i for i, title in enumerate(titles)}
+        for measure in MEASURES:
+            setattr(self, measure, counts[measure])
+        self.authors = authors
+        self.totals = totals if totals is not None else cube_totals(counts)
+        self.total_sales = self.totals['total_sales']
+
+        # Per-title totals, in the same shape as the book_sales / book_ratings tables used by the layout
+        # (copy=False keeps memory-mapped totals mapped)
+        self.book_sales = pd.DataFrame({'Title': self.titles, 'Total Sales': self.totals['title_sales']}, copy=False)
+        self.book_ratings = pd.DataFrame({'Title': self.titles, 'Rating': self.totals['title_ratings']}, copy=False)
+        self.top_sales = self.book_sales.iloc[self.totals['top_sales']]
+        self.top_ratings = self.book_ratings.iloc[self.totals['top_ratings']]
+
+    # Build the cube from the full merged sales table
+    @classmethod
+    def from_merged(cls, df_merged):
+        quarters = list(df_merged['Quarter'].cat.categories)
+        counts = {measure: np.zeros((0, len(quarters)), dtype=np.int64) for measure in MEASURES}
+        empty_cube = cls([], quarters, counts, [])
+        return empty_cube.add_counts(count_by_title_and_quarter(df_merged), first_authors(df_merged))
+
+    # Return a new cube with the counts of a few appended merged sales rows added
+    def with_delta(self, delta_merged):
+        if len(delta_merged) == 0:
+            return self
+        return self.add_counts(count_by_title_and_quarter(delta_merged), first_authors(delta_merged))
+
+    # Return a new cube with grouped counts added, growing it for titles it has not seen yet
+    def add_counts(self, grouped, authors):
+        group_titles = grouped.index.get_level_values('Title')
+        new_titles = [title for title in group_titles.unique() if title not in self.title_index]
+        titles = self.titles + new_titles
+        title_index = {title: i for i, title in enumerate(titles)}
+        all_authors = list(self.authors) + [authors[title] for title in new_titles]
+
+        row_positions = np.array([title_index[title] for title in group_titles], dtype=np.int64)
+        column_positions = np.asarray(
+            pd.Categorical(grouped.index.get_level_values('Quarter'), categories=self.quarters).codes, dtype=np.int64)
+        counts = {}
+        for measure in MEASURES:
+            values = np.zeros((len(titles), len(self.quarters)), dtype=np.int64)
+            values[:len(self.titles)] = getattr(self, measure)
+            np.add.at(values, (row_positions, column_positions), grouped[measure].to_numpy())
+            counts[measure] = values
+        return SalesCube(titles, self.quarters, counts, all_authors)
+
+    # Total sales of one title as a one-row table (empty if the title is unknown)
+    def title_sales(self, title):
+        i = self.title_index.get(title)
+        return self.book_sales.iloc[[] if i is None else [i]]
+
+    # Average rating of one title as a one-row table (empty if the title is unknown)
+    def title_rating(self, title):
+        i = self.title_index.get(title)
+        return self.book_ratings.iloc[[] if i is None else [i]]
+
+    # Total sales per quarter for one title, or for all titles when `title` is None
+    def quarter_trend(self, title=None):
+        if title is None:
+            rows = self.rows.sum(axis=0)
+            total_sales = self.total_sales.sum(axis=0)
+        else:
+            i = self.title_index.get(title)
+            rows = self.rows[i] if i is not None else np.zeros(len(self.quarters), dtype=np.int64)
+            total_sales = self.total_sales[i] if i is not None else rows
+        observed = rows > 0  # Only quarters that actually have sales rows, as groupby(observed=True) did
+        return pd.DataFrame({
+            'Quarter': [quarter for quarter, seen in zip(self.quarters, observed) if seen],
+            'Total Sales': total_sales[observed],
+        })
+
+    # Author name of one title, or None if the title is unknown
+    def author_name(self, title):
+        i = self.title_index.get(title)
+        return None if i is None else self.authors[i]
@@ -0,0 +1,107 @@
+# Daily orders per title, indexed by cumulative sums
+# Built once when the data is loaded: any day, week, month or custom date range is then answered with two array
+# lookups per bucket (cumulative[end] - cumulative[start]) instead of regrouping the sales rows
+import numpy as np
+import pandas as pd
+
+# Columns of the merged sales rows the time series is built from
+INPUT_COLUMNS = ['Title', 'Sale Date', 'OrderID']
+
+# Bucket sizes the trend chart offers, as pandas frequencies of the bucket starts
+GRANULARITIES = {'day': 'D', 'week': 'W-MON', 'month': 'MS'}
+
+
+# Function to turn a date (string, Timestamp or datetime64) into a numpy day
+def to_day(date):
+    return pd.Timestamp(date).to_datetime64().astype('datetime64[D]')
+
+
+class SalesTimeSeries:
+    # `cumulative` is a (titles x days + 1) array: cumulative[i, d] is the number of orders of title i on the days
+    # before first_day + d, so the orders between two days are one subtraction
+    # Rows follow `titles`, the same order as the SalesCube of the snapshot
+    # `total_cumulative` is the same for all titles together, when it is already known (read from a snapshot folder)
+    # Never modified after it is built: with_delta() returns a new one
+    def __init__(self, titles, first_day, cumulative, total_cumulative=None):
+        self.titles = titles
+        self.title_index = {title: i for i, title in enumerate(titles)}
+        self.first_day = np.datetime64(first_day, 'D')
+        self.cumulative = cumulative
+        if total_cumulative is None:
+            total_cumulative = cumulative.sum(axis=0, dtype=np.int64)
+        self.total_cumulative = total_cumulative
+        self.n_days = cumulative.shape[1] - 1
+        self.last_day = self.first_day + max(self.n_days - 1, 0)
+
+    # Build the index from merged sales rows; `titles` fixes the row order (titles not in it are ignored)
+    @classmethod
+    def from_merged(cls, df_merged, titles):
+        empty = cls(titles, np.datetime64('1970-01-01', 'D'), np.zeros((len(titles), 1), dtype=np.int64))
+        return empty.with_delta(df_merged, titles)
+
+    # Title row and day of every merged sales row with an order and a sale date
+    @staticmethod
+    def order_days(df_merged, title_index):
+        dated = df_merged[df_merged['Sale Date'].notna() & df_merged['OrderID'].notna()]
+        titles = dated['Title'].astype('category')
+        # Row of every title category, with an extra last slot for missing titles (code -1)
+        category_rows = np.array([title_index.get(title, -1) for title in titles.cat.categories] + [-1],
+                                 dtype=np.int64)
+        rows = category_rows[titles.cat.codes.to_numpy()]
+        days = dated['Sale Date'].to_numpy().astype('datetime64[D]')
+        known = rows >= 0
+        return rows[known], days[known]
+
+    # Return a new index with the orders of a few more merged sales rows added, growing it for new titles and days
+    # `titles` is the title order of the new index (the existing titles first, as SalesCube.add_counts keeps them)
+    def with_delta(self, df_merged, titles):
+        title_index = {title: i for i, title in enumerate(titles)}
+        rows, days = self.order_days(df_merged, title_index)
+        if len(days) == 0 and len(titles) == len(self.titles):
+            return self
+
+        daily = np.diff(self.cumulative, axis=1)
+        if self.n_days == 0 or daily.sum() == 0:
+            first_day = days.min() if len(days) else self.first_day
+            last_day = days.max() if len(days) else self.first_day
+            old_offset = 0
+            daily = np.zeros((len(self.titles), 0), dtype=np.int64)
+        else:
+            first_day = min(self.first_day, days.min()) if len(days) else self.first_day
+            last_day = max(self.last_day, days.max()) if len(days) else self.last_day
+            old_offset = int((self.first_day - first_day).astype(int))
+
+        n_days = int((last_day - first_day).astype(int)) + 1
+        new_daily = np.zeros((len(titles), n_days), dtype=np.int64)
+        new_daily[:daily.shape[0], old_offset:old_offset + daily.shape[1]] = daily
+        day_positions = (days - first_day).astype(np.int64)
+        new_daily += np.bincount(rows * n_days + day_positions, minlength=len(titles) * n_days).reshape(
+            len(titles), n_days)
+
+        cumulative = np.zeros((len(titles), n_days + 1), dtype=np.int32)  # Order counts fit easily in 32 bits
+        np.cumsum(new_daily, axis=1, out=cumulative[:, 1:])
+        return SalesTimeSeries(titles, first_day, cumulative)
+
+    # Orders per bucket ('day', 'week' or 'month') between two dates (inclusive), for one title or for all titles
+    # when `title` is None; returns a table with the start of every bucket and its orders
+    def trend(self, title=None, start=None, end=None, granularity='day'):
+        if title is None:
+            cumulative = self.total_cumulative
+        else:
+            i = self.title_index.get(title)
+            cumulative = self.cumulative[i] if i is not None else np.zeros(self.n_days + 1, dtype=np.int32)
+
+        start = max(to_day(start), self.first_day) if start else self.first_day
+        end = min(to_day(end), self.last_day) if end else self.last_day
+        if self.n_days == 0 or start > end:
+            return pd.DataFrame({'Date': pd.to_datetime([]), 'Orders': np.zeros(0, dtype=np.int64)})
+
+        # Bucket boundaries: the first requested day, every bucket start after it, and the day after the last one
+        bucket_starts = pd.date_range(start, end, freq=GRANULARITIES[granularity]).to_numpy().astype('datetime64[D]')
+        bucket_starts = np.unique(np.concatenate([[start], bucket_starts]))
+        edges = np.concatenate([bucket_starts, [end + 1]])
+        positions = (edges - self.first_day).astype(np.int64)
+        return pd.DataFrame({
+            'Date': pd.to_datetime(bucket_starts),
+            'Orders': cumulative[positions[1:]] - cumulative[positions[:-1]],  # One subtraction per bucket
+        })
@@ -0,0 +1,138 @@
+# On-disk snapshot cache for the Google Sheets ranges
+# Every range is stored as an uncompressed Feather (Arrow) file so restarts can memory-map it instead of downloading it
+import hashlib
+import json
+import os
+import re
+import time
+
+import pandas as pd
+import pyarrow.feather as feather
+
+from sheets_loader import SPREADSHEET_ID, fetch_all_frames
+
+# Default location and freshness of the cache (both can be changed with environment variables)
+DEFAULT_CACHE_DIR = os.getenv("SHEETS_CACHE_DIR", ".sheet_cache")
+DEFAULT_CACHE_TTL = float(os.getenv("SHEETS_CACHE_TTL", "900"))  # Seconds before a snapshot is refetched
+
+
+# Function to compute a content hash of a DataFrame (column names and cell values)
+def frame_content_hash(df):
+    digest = hashlib.sha256()
+    digest.update(json.dumps([str(column) for column in df.columns]).encode())
+    if len(df):
+        digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()[:16]
+
+
+class SheetCache:
+    # Snapshots live in <cache_dir>/<spreadsheet id>/<range>/<content hash>.feather,
+    # next to a manifest.json that records which hash is current and when it was fetched
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl=DEFAULT_CACHE_TTL, offline=False,
+                 spreadsheet_id=SPREADSHEET_ID):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.offline = offline
+        self.spreadsheet_id = spreadsheet_id
+
+    # Folder holding the snapshots of one range ("Sales Q1!A1:E7786" -> "Sales_Q1_A1_E7786")
+    def range_dir(self, sheet_range):
+        return os.path.join(self.cache_dir, self.spreadsheet_id, re.sub(r"[^A-Za-z0-9]+", "_", sheet_range))
+
+    def read_manifest(self, sheet_range):
+        path = os.path.join(self.range_dir(sheet_range), "manifest.json")
+        try:
+            with open(path) as manifest_file:
+                return json.load(manifest_file)
+        except (OSError, ValueError):
+            return None
+
+    def write_manifest(self, sheet_range, manifest):
+        path = os.path.join(self.range_dir(sheet_range), "manifest.json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(tmp_path, path)  # Readers only ever see a complete manifest
+
+    # Check whether the snapshot is younger than the TTL
+    def is_fresh(self, manifest):
+        return manifest is not None and time.time() - manifest['fetched_at'] < self.ttl
+
+    # Load the current snapshot of a range, or None if there is none
+    def load(self, sheet_range):
+        manifest = self.read_manifest(sheet_range)
+        if manifest is None:
+            return None
+        path = os.path.join(self.range_dir(sheet_range), manifest['hash'] + ".feather")
+        try:
+            table = feather.read_table(path, memory_map=True)  # Memory-mapped, no copy through Python
+        except OSError:
+            return None
+        df = table.to_pandas()
+        df.attrs['sheet_rows'] = manifest.get('sheet_rows', len(df))  # Sheet rows read, including rejected ones
+        return df
+
+    # Save a freshly fetched range; an unchanged hash only refreshes the timestamp
+    def store(self, sheet_range, df):
+        folder = self.range_dir(sheet_range)
+        os.makedirs(folder, exist_ok=True)
+        content_hash = frame_content_hash(df)
+        path = os.path.join(folder, content_hash + ".feather")
+        if not os.path.exists(path):
+            tmp_path = path + ".tmp"
+            feather.write_feather(df.reset_index(drop=True), tmp_path, compression="uncompressed")
+            os.replace(tmp_path, path)
+        self.write_manifest(sheet_range, {'hash': content_hash, 'fetched_at': time.time(), 'rows': len(df),
+                                          'sheet_rows': df.attrs.get('sheet_rows', len(df))})
+        # Remove older snapshots of this range (processes that mapped them keep their open handle)
+        for file_name in os.listdir(folder):
+            if file_name.endswith(".feather") and file_name != content_hash + ".feather":
+                os.remove(os.path.join(folder, file_name))
+
+
+# Function to load several ranges through the cache
+# Fresh snapshots come from disk, the rest are fetched concurrently; a failed fetch falls back to the stale snapshot
+# Raises a RuntimeError naming the ranges that have neither fresh data nor a snapshot
+def load_ranges_cached(ranges, api_key, cache, **fetch_kwargs):
+    frames = {}
+    timings = {}
+    to_fetch = {}
+    missing = []
+    for name, sheet_range in ranges.items():
+        manifest = cache.read_manifest(sheet_range)
+        if cache.offline or cache.is_fresh(manifest):
+            start = time.perf_counter()
+            df = cache.load(sheet_range)
+            timings[name] = time.perf_counter() - start
+            if df is None:
+                if cache.offline:
+                    print(f"Offline mode: no cached snapshot for {name}")
+                    missing.append(f"{name} (offline)")
+                    continue
+                to_fetch[name] = sheet_range
+            else:
+                frames[name] = df
+                print(f"Loaded {name} from cache: {len(df)} rows in {timings[name] * 1000:.1f}ms")
+        else:
+            to_fetch[name] = sheet_range
+
+    if to_fetch:
+        fetched_frames, fetch_timings = fetch_all_frames(to_fetch, api_key, **fetch_kwargs)
+        for name, sheet_range in to_fetch.items():
+            timings[name] = fetch_timings[name]
+            df = fetched_frames[name]
+            if df is None:
+                df = cache.load(sheet_range)  # API failed: serve the stale snapshot if there is one
+                if df is None:
+                    print(f"Giving up on {name}: API failed and no cached snapshot")
+                    missing.append(f"{name} (API failed)")
+                    continue
+                print(f"API failed for {name}, using stale snapshot with {len(df)} rows")
+            else:
+                cache.store(sheet_range, df)
+                print(f"Loaded {name}: {len(df)} rows in {timings[name]:.2f}s")
+            frames[name] = df
+
+    if missing:
+        raise RuntimeError(f"No cached snapshot for {', '.join(missing)}")
+    return {name: frames[name] for name in ranges}, timings
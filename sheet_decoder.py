@@ -0,0 +1,277 @@
+# Decoding of Sheets API responses straight into DataFrame columns
+# The API sends every range as a list of rows of strings. Instead of building a DataFrame row by row from Python
+# lists, the rows are handed to Arrow once and every column is gathered from them with one vectorized take, so each
+# column ends up as a single Arrow string array (the storage of pandas' string dtype)
+# Parsing itself uses orjson when it is installed, with the garbage collector paused; with more than one CPU,
+# responses (such as the streamed blocks of the Sales sheets) are parsed by a pool of processes, so the sheets loaded
+# concurrently are parsed in parallel instead of taking turns on the interpreter lock. The pool only lives while a
+# load is running (see using_decode_processes): none is left to copy when gunicorn forks, or to sit idle
+import gc
+import json
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from metrics import metrics
+
+try:
+    import orjson  # Optional: parses these responses several times faster than the json module
+except ImportError:
+    orjson = None
+
+# Responses at least this large are parsed by the decode processes (a streamed block of 5000 Sales rows is about
+# 340 KB); responses several times larger are cut into one chunk of rows per process
+PARALLEL_DECODE_BYTES = int(os.getenv("SHEETS_PARALLEL_DECODE_BYTES", str(256 * 1024)))
+
+# Number of decode processes (default: one per CPU, at most 4, as each one imports the app again; 1 parses
+# everything in the calling thread)
+DECODE_PROCESSES = int(os.getenv("SHEETS_DECODE_PROCESSES", "0")) or min(4, os.cpu_count() or 1)
+
+# dtype of the decoded text columns: pandas' string dtype stored in Arrow
+STRING_DTYPE = pd.StringDtype('pyarrow', na_value=np.nan)
+
+# Where one row of the 'values' array ends and the next starts: `],[` (with optional whitespace)
+ROW_BOUNDARY = re.compile(rb"\]\s*,\s*\[")
+
+# Rows copied into Arrow at a time: the Python lists of each batch are freed as soon as it is copied
+ARROW_BATCH_ROWS = 16384
+
+# Pool of decode processes, started on the first large response; the fetch threads share it
+decode_pool = None
+decode_pool_lock = threading.Lock()
+
+# Number of loads running with the decode processes; the pool is shut down when the last of them ends
+pool_users = 0
+
+# After this many pools in a row broke (workers that cannot start will never work), responses are parsed in the
+# calling thread only
+MAX_POOL_FAILURES = 3
+pool_failures = 0
+
+
+# Context manager pausing the garbage collector: parsing creates one object per cell, and every few hundred of them
+# the collector would scan all of them again without ever finding garbage
+@contextmanager
+def gc_paused():
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+# Context manager letting the responses decoded inside it use the decode processes; the pool started for them is
+# shut down (waiting for its processes to exit) when the last load using it ends
+@contextmanager
+def using_decode_processes():
+    global decode_pool, pool_users
+    with decode_pool_lock:
+        pool_users += 1
+    try:
+        yield
+    finally:
+        with decode_pool_lock:
+            pool_users -= 1
+            pool = decode_pool if pool_users == 0 else None
+            if pool is not None:
+                decode_pool = None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+
+# Function to parse a JSON response body (bytes)
+def loads(raw):
+    with gc_paused():
+        return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+# Function to copy rows of cells (lists of strings) into one Arrow list array, after which the Python lists can go
+def rows_to_arrow(rows):
+    with gc_paused():
+        return pa.array(rows, type=pa.list_(pa.string()))
+
+
+# Function to copy a list of rows into Arrow in batches, starting from the end so every batch copied can be cut off
+# the list at once. Empties `rows`; returns the Arrow list arrays of the batches in row order
+def rows_to_arrow_batches(rows):
+    batches = []
+    while rows:
+        batches.append(rows_to_arrow(rows[-ARROW_BATCH_ROWS:]))
+        del rows[-ARROW_BATCH_ROWS:]
+    return batches[::-1]
+
+
+# Function to turn an Arrow array of rows into one Arrow string array per column
+# The API leaves out trailing empty cells, so rows can be shorter than `n_columns`: their missing cells become nulls
+def arrow_rows_to_columns(arrow_rows, n_columns):
+    cells = arrow_rows.flatten()
+    offsets = arrow_rows.offsets.to_numpy()
+    row_starts, row_lengths = offsets[:-1], np.diff(offsets)
+    # Column i of every row is cell row_start + i, or null where the row is too short to have it
+    return [pc.take(cells, pa.array(row_starts + i, mask=row_lengths <= i)) for i in range(n_columns)]
+
+
+# Function to turn rows of cells into one Arrow string array per column
+def rows_to_columns(rows, n_columns):
+    return arrow_rows_to_columns(rows_to_arrow(rows), n_columns)
+
+
+# Function to build a DataFrame of string columns from Arrow arrays (or lists of Arrow arrays, one per chunk)
+def columns_to_frame(header, columns):
+    data = {}
+    for name, column in zip(header, columns):
+        if isinstance(column, list):
+            column = pa.chunked_array(column, type=pa.string())
+        data[name] = pd.Series(column, dtype=STRING_DTYPE)
+    return pd.DataFrame(data, columns=header)
+
+
+# Function to turn rows of cells into a DataFrame with the given column names (like pd.DataFrame(rows, header),
+# with shorter rows padded with missing values)
+def rows_to_frame(rows, header):
+    with metrics.stage('sheets_to_frame') as span:
+        span.rows = len(rows)
+        return columns_to_frame(header, rows_to_columns(rows, len(header)))
+
+
+# Function to find the 'values' array in a response body: returns the positions of its `[` and `]`, or None if the
+# body is not laid out as expected (the array is checked to be the last member, as the API writes it)
+def find_values_array(raw):
+    key = raw.find(b'"values"')
+    if key < 0:
+        return None
+    start = raw.find(b'[', key)
+    end = raw.rfind(b']')
+    if start < 0 or end <= start:
+        return None
+    try:
+        envelope = loads(raw[:start] + b'[]' + raw[end + 1:])
+    except ValueError:
+        return None
+    if not isinstance(envelope, dict) or envelope.get('values') != []:
+        return None
+    return start, end
+
+
+# Function to split the rows of a 'values' array (the text between its brackets) into about `pieces` chunks of
+# whole rows
+def split_rows(rows_text, pieces):
+    cuts = []
+    starts = [0]
+    for piece in range(1, pieces):
+        boundary = ROW_BOUNDARY.search(rows_text, max(len(rows_text) * piece // pieces, starts[-1] + 1))
+        if boundary is None:
+            break
+        cuts.append(boundary.start() + 1)
+        starts.append(boundary.end() - 1)
+    cuts.append(len(rows_text))
+    return [rows_text[start:cut] for start, cut in zip(starts, cuts) if start < cut]
+
+
+# Function run in a decode process: parse one chunk of rows and return its columns
+# A cut inside a quoted cell would make the chunk invalid JSON; the ValueError then makes the caller parse the whole
+# response in one piece instead
+def decode_rows_chunk(chunk, n_columns):
+    rows = loads(b'[' + chunk + b']')
+    return len(rows), rows_to_columns(rows, n_columns)
+
+
+# Function to get the pool of decode processes, starting it on first use
+def get_decode_pool():
+    global decode_pool
+    with decode_pool_lock:
+        if decode_pool is None:
+            # Spawned rather than forked: the loader calls this from its fetch threads
+            decode_pool = ProcessPoolExecutor(DECODE_PROCESSES, mp_context=multiprocessing.get_context('spawn'))
+        return decode_pool
+
+
+# Function to drop a pool that broke (a worker died or could not be started), so the next response starts a new one
+def discard_decode_pool(pool, error):
+    global decode_pool, pool_failures
+    with decode_pool_lock:
+        if decode_pool is pool:
+            decode_pool = None
+            pool_failures += 1
+            print(f"Decode processes failed ({type(error).__name__}: {error}), parsing in this process instead")
+            if pool_failures == MAX_POOL_FAILURES:
+                print(f"Decode processes failed {MAX_POOL_FAILURES} times in a row, no longer using them")
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Function to parse a response on the decode processes; returns the header, the columns (a list of Arrow arrays per
+# column) and the number of rows, or None if the body could not be split safely or the processes failed
+def decode_in_processes(raw, header):
+    global pool_failures
+    values_array = find_values_array(raw)
+    if values_array is None:
+        return None
+    start, end = values_array
+    rows_text = raw[start + 1:end]
+    if header is None:
+        # The first row holds the column headers; it is parsed here, the rows below it on the decode processes
+        first = ROW_BOUNDARY.search(rows_text)
+        header_text = rows_text if first is None else rows_text[:first.start() + 1]
+        rows_text = b'' if first is None else rows_text[first.end() - 1:]
+        try:
+            header = loads(b'[' + header_text + b']')[0]
+        except (ValueError, IndexError):
+            return None
+    chunks = split_rows(rows_text, max(1, min(DECODE_PROCESSES, len(raw) // max(PARALLEL_DECODE_BYTES, 1))))
+    pool = get_decode_pool()
+    try:
+        results = list(pool.map(decode_rows_chunk, chunks, [len(header)] * len(chunks)))
+    except ValueError:
+        return None
+    except (BrokenProcessPool, OSError) as error:
+        discard_decode_pool(pool, error)
+        return None
+    pool_failures = 0
+    columns = [[chunk_columns[i] for _, chunk_columns in results] for i in range(len(header))]
+    return header, columns, sum(n_rows for n_rows, _ in results)
+
+
+# Function to decode a `values` response body straight into a DataFrame
+# `header` is the known column names when the range does not start at the header row
+# Returns the header and the DataFrame of the rows below it, or (header, None) if the range has no values at all
+def decode_value_range(raw, header=None):
+    # Buffers Arrow keeps cached from frames freed since the last load go back to the system before parsing, so they
+    # do not add to this load's peak memory
+    pa.default_memory_pool().release_unused()
+    if (DECODE_PROCESSES > 1 and pool_users and len(raw) >= PARALLEL_DECODE_BYTES
+            and pool_failures < MAX_POOL_FAILURES):
+        with metrics.stage('sheets_json_parse') as span:
+            decoded = decode_in_processes(raw, header)
+            span.rows = decoded[2] if decoded else 0
+        if decoded is not None:
+            header, columns, _ = decoded
+            with metrics.stage('sheets_to_frame') as span:
+                df = columns_to_frame(header, columns)
+                span.rows = len(df)
+            return header, df
+
+    with metrics.stage('sheets_json_parse') as span:
+        values = loads(raw).get('values', [])
+        span.rows = len(values)
+    if not values:
+        return header, None
+    if header is None:
+        header = values.pop(0)  # First row contains the column headers
+    with metrics.stage('sheets_to_frame') as span:
+        span.rows = len(values)
+        batches = rows_to_arrow_batches(values)
+        batch_columns = [arrow_rows_to_columns(batch, len(header)) for batch in batches]
+        columns = [[chunk_columns[i] for chunk_columns in batch_columns] for i in range(len(header))]
+        df = columns_to_frame(header, columns)
+    return header, df
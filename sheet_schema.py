@@ -0,0 +1,145 @@
+# Declared column types of the bookshop sheets
+# Every sheet is converted on ingest: join keys and repeated labels become categoricals (dictionary encoded),
+# counts become nullable integers and dates become real datetimes instead of Python strings
+import pandas as pd
+
+# Column types per sheet
+#   'key'      - join key, stored as a categorical whose categories are shared with the other sheets
+#   'category' - repeated text label, stored as a categorical
+#   'int'      - nullable integer
+#   'float'    - 32-bit float
+#   'date'     - datetime
+SHEET_SCHEMAS = {
+    'Book': {
+        'BookID': 'key',
+        'Title': 'category',
+        'AuthID': 'key',
+    },
+    'Edition': {
+        'ISBN': 'key',
+        'BookID': 'key',
+        'Format': 'category',
+        'PubID': 'category',
+        'Publication Date': 'date',
+        'Pages': 'int',
+        'Print Run Size (k)': 'int',
+        'Price': 'float',
+    },
+    'Sales': {
+        'Sale Date': 'date',
+        'ISBN': 'key',
+        'Discount': 'float',
+        'ItemID': 'category',
+        'OrderID': 'key',
+    },
+    'Author': {
+        'AuthID': 'key',
+        'First Name': 'category',
+        'Last Name': 'category',
+        'Birthday': 'date',
+        'Country of Residence': 'category',
+        'Hrs Writing per Day': 'float',
+    },
+}
+
+# Columns a row cannot do without; rows missing any of them are rejected
+REQUIRED_COLUMNS = {
+    'Book': ['BookID', 'Title'],
+    'Edition': ['ISBN', 'BookID'],
+    'Sales': ['ISBN'],
+    'Author': ['AuthID'],
+}
+
+# pandas dtype each schema type ends up as (used to skip columns that are already converted)
+TARGET_DTYPES = {
+    'key': 'category',
+    'category': 'category',
+    'int': 'Int32',
+    'float': 'float32',
+}
+
+
+# Function to check whether a column already has the dtype its schema type asks for
+def has_target_dtype(series, column_type):
+    if column_type == 'date':
+        return pd.api.types.is_datetime64_any_dtype(series.dtype)
+    return series.dtype == TARGET_DTYPES[column_type]
+
+
+# Function to check whether every schema column a DataFrame has is already of its target dtype
+def has_schema_dtypes(df, sheet_name):
+    return all(has_target_dtype(df[column], column_type)
+               for column, column_type in SHEET_SCHEMAS[sheet_name].items() if column in df)
+
+
+# Function to convert one string column to its schema type; values that cannot be converted become missing
+def convert_column(series, column_type):
+    if column_type in ('key', 'category'):
+        return series.where(series != '').astype('category')  # Empty cells are missing, not a category
+    if column_type == 'int':
+        numbers = pd.to_numeric(series, errors='coerce')
+        return numbers.where(numbers % 1 == 0).astype('Int32')  # Fractions are not valid integers
+    if column_type == 'float':
+        return pd.to_numeric(series, errors='coerce').astype('float32')
+    if column_type == 'date':
+        return pd.to_datetime(series, errors='coerce')
+    raise ValueError(f"Unknown column type: {column_type}")
+
+
+# Function to apply the schema of a sheet to a DataFrame
+# Rows missing a required column are dropped; rejected rows, coerced cells and the memory footprint before and
+# after are added to `report` (a dict keyed by `label`, which defaults to the sheet name) if one is given
+def apply_schema(df, sheet_name, report=None, label=None):
+    schema = SHEET_SCHEMAS[sheet_name]
+    bytes_before = int(df.memory_usage(deep=True).sum())
+    coerced = {}
+    for column, column_type in schema.items():
+        if column not in df or has_target_dtype(df[column], column_type):
+            continue
+        original = df[column]
+        converted = convert_column(original, column_type)
+        present = original.notna() & (original != '')
+        bad_cells = int((present & converted.isna()).sum())  # Had a value, but not one of the right type
+        if bad_cells:
+            coerced[column] = bad_cells
+        df[column] = converted
+
+    required = [column for column in REQUIRED_COLUMNS[sheet_name] if column in df]
+    rows = len(df)
+    if required:
+        df = df.dropna(subset=required)
+    rejected = rows - len(df)
+
+    if report is not None:
+        sheet_report = report.setdefault(label or sheet_name, {'rows': 0, 'rejected': 0, 'coerced': {},
+                                                                'bytes_before': 0, 'bytes_after': 0})
+        sheet_report['rows'] += rows
+        sheet_report['rejected'] += rejected
+        for column, count in coerced.items():
+            sheet_report['coerced'][column] = sheet_report['coerced'].get(column, 0) + count
+        sheet_report['bytes_before'] += bytes_before
+        sheet_report['bytes_after'] += int(df.memory_usage(deep=True).sum())
+    return df
+
+
+# Function to give a key column the same categories in every DataFrame that has it
+# Merges and comparisons on categoricals with identical categories work on the integer codes
+def align_categories(frames, column):
+    columns = [df[column] for df in frames if column in df]
+    if not columns:
+        return frames
+    categories = pd.api.types.union_categoricals(
+        [c if isinstance(c.dtype, pd.CategoricalDtype) else c.astype('category') for c in columns],
+        ignore_order=True,
+    ).categories
+    return [df.assign(**{column: pd.Categorical(df[column], categories=categories)}) if column in df else df
+            for df in frames]
+
+
+# Function to print the schema report collected by apply_schema
+def print_schema_report(report):
+    for label, sheet_report in report.items():
+        coerced = ", ".join(f"{column}: {count}" for column, count in sheet_report['coerced'].items()) or "none"
+        print(f"{label}: {sheet_report['rows']} rows, {sheet_report['rejected']} rejected, "
+              f"bad values set to missing: {coerced}, "
+              f"memory {sheet_report['bytes_before'] / 1e6:.2f} MB -> {sheet_report['bytes_after'] / 1e6:.2f} MB")
@@ -0,0 +1,264 @@
+# Helpers for loading the bookshop data from the Google Sheets API
+# All ranges are fetched concurrently over one pooled keep-alive session, or with a single batchGet request
+# Response bodies are decoded straight into DataFrame columns (see sheet_decoder.py)
+import os
+import re
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import metrics
+from sheet_decoder import decode_value_range, loads, rows_to_frame, using_decode_processes
+
+# Spreadsheet holding the Book, Edition, Sales and Author sheets
+SPREADSHEET_ID = "1d974FnqiPtsTgekWMJBuD8mkeN0v7xo2MpBUhd_CNKw"
+
+# Base URL of the Sheets API (can be pointed at a local stand-in server)
+SHEETS_API_BASE = os.getenv("SHEETS_API_BASE", "https://sheets.googleapis.com/v4/spreadsheets")
+
+# Ranges loaded by the dashboard, keyed by the name used in the code
+# Ranges without row numbers are streamed in blocks until the sheet runs out of rows, so rows appended to any sheet
+# (a new book, edition or author as much as new sales) are picked up
+SHEET_RANGES = {
+    'Book': "Book!A:C",
+    'Sales Q1': "Sales Q1!A:E",
+    'Sales Q2': "Sales Q2!A:E",
+    'Sales Q3': "Sales Q3!A:E",
+    'Sales Q4': "Sales Q4!A:E",
+    'Edition': "Edition!A:H",
+    'Author': "Author!A:F",
+}
+
+# Number of rows requested per block when streaming a sheet
+STREAM_BLOCK_ROWS = int(os.getenv("SHEETS_BLOCK_ROWS", "5000"))
+
+# HTTP status codes worth retrying (rate limiting and server-side errors)
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+# Function to create one HTTP session whose connection pool is shared by all fetches
+def make_session(pool_size=8):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)  # Keep-alive connections reused across threads
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Function to build the API URL for a single range
+def build_range_url(sheet_range, api_key, spreadsheet_id=SPREADSHEET_ID, base_url=None):
+    base_url = base_url or SHEETS_API_BASE
+    quoted_range = urllib.parse.quote(sheet_range, safe="!:")  # Sheet names such as "Sales Q1" contain spaces
+    return f"{base_url}/{spreadsheet_id}/values/{quoted_range}?key={api_key}"
+
+
+# Function to build the API URL for a batchGet request covering several ranges
+def build_batch_url(sheet_ranges, api_key, spreadsheet_id=SPREADSHEET_ID, base_url=None):
+    base_url = base_url or SHEETS_API_BASE
+    query = urllib.parse.urlencode([('ranges', r) for r in sheet_ranges] + [('key', api_key)])
+    return f"{base_url}/{spreadsheet_id}/values:batchGet?{query}"
+
+
+# Function to GET a URL and return the parsed JSON, retrying with exponential backoff
+# With `decode`, the response body (bytes) is passed to it instead and its result is returned
+# Returns None if every attempt failed
+def get_json_with_retry(session, url, retries=3, backoff=0.5, timeout=30, decode=None):
+    for attempt in range(retries + 1):
+        try:
+            with metrics.stage('sheets_http'):
+                response = session.get(url, timeout=timeout)
+            if response.status_code == 200:
+                if decode is not None:
+                    return decode(response.content)  # The decoder records its own stages
+                with metrics.stage('sheets_json_parse') as span:
+                    data = loads(response.content)
+                    span.rows = len(data.get('values', []))
+                return data
+            print(f"Failed to fetch data. HTTP Status Code: {response.status_code}")
+            if response.status_code not in RETRY_STATUS_CODES:
+                return None  # Client errors (bad key, bad range) will not succeed on a retry
+        except requests.RequestException as error:
+            print(f"Failed to fetch data: {error}")
+        if attempt < retries:
+            time.sleep(backoff * (2 ** attempt))  # Wait 0.5s, 1s, 2s, ... between attempts
+    return None
+
+
+# Function to turn the 'values' list returned by the API into a DataFrame
+def values_to_dataframe(values):
+    if values:
+        header = values[0]  # First row contains the column headers
+        rows = values[1:]  # The rest of the rows contain the actual data
+        return rows_to_frame(rows, header)
+    print("No data found in the sheet")
+    return pd.DataFrame()
+
+
+# Function to fetch one range and decode it straight into a DataFrame
+# `header` is the known column names when the range does not start at the header row
+# Returns the header and the DataFrame (None if the range has no values), or None if the fetch failed
+def fetch_range_decoded(session, sheet_range, api_key, retries=3, backoff=0.5, spreadsheet_id=SPREADSHEET_ID,
+                        base_url=None, header=None):
+    url = build_range_url(sheet_range, api_key, spreadsheet_id, base_url)
+    return get_json_with_retry(session, url, retries=retries, backoff=backoff,
+                               decode=lambda raw: decode_value_range(raw, header))
+
+
+# Function to concatenate typed chunks, merging the categories of categorical columns
+# (pd.concat would silently fall back to object columns when the categories differ)
+def concat_chunks(chunks):
+    if not chunks:
+        return pd.DataFrame()
+    if len(chunks) == 1:
+        return chunks[0].reset_index(drop=True)
+    categorical_columns = [column for column in chunks[0].columns
+                           if isinstance(chunks[0][column].dtype, pd.CategoricalDtype)]
+    for column in categorical_columns:
+        if all(isinstance(chunk[column].dtype, pd.CategoricalDtype) for chunk in chunks):
+            categories = pd.api.types.union_categoricals([chunk[column] for chunk in chunks]).categories
+            chunks = [chunk.assign(**{column: chunk[column].cat.set_categories(categories)}) for chunk in chunks]
+    return pd.concat(chunks, ignore_index=True)
+
+
+# Function to check whether a range is open-ended, like "Sales Q1!A:E", and should be streamed
+def is_open_ended(sheet_range):
+    return re.search(r"![A-Z]+:[A-Z]+$", sheet_range) is not None
+
+
+# Function to build the A1 range of `block_rows` rows starting at `first_row` of an open-ended range
+# ("Sales Q1!A:E" -> "Sales Q1!A1:E5000")
+def block_range(sheet_range, first_row, block_rows):
+    sheet_name, _, columns = sheet_range.rpartition("!")
+    first_column, last_column = columns.split(":")
+    return f"{sheet_name}!{first_column}{first_row}:{last_column}{first_row + block_rows - 1}"
+
+
+# Function to read an open-ended range in fixed row blocks until an empty block is returned
+# Each block is converted to a typed DataFrame as it arrives, so only one block of raw JSON is alive at a time
+# To read only rows appended after a known point, pass the sheet row to start at and the known header
+# The number of sheet rows read (before any row is rejected by `convert`) is kept in df.attrs['sheet_rows']
+# Returns None if any block could not be fetched
+def stream_sheet_frame(session, sheet_range, api_key, block_rows=STREAM_BLOCK_ROWS, convert=None, retries=3,
+                       backoff=0.5, spreadsheet_id=SPREADSHEET_ID, base_url=None, first_row=1, header=None):
+    chunks = []
+    sheet_rows = 0
+    while True:
+        # The first row of the first block contains the column headers; shorter rows are padded with missing values
+        decoded = fetch_range_decoded(session, block_range(sheet_range, first_row, block_rows), api_key, retries,
+                                      backoff, spreadsheet_id, base_url, header)
+        if decoded is None:
+            return None
+        block_header, block = decoded
+        if block is None:
+            break  # Past the last row of the sheet
+        header = block_header
+        sheet_rows += len(block)
+        chunks.append(convert(block) if convert else block)
+        first_row += block_rows
+    if header is None:
+        print("No data found in the sheet")
+        return pd.DataFrame()
+    df = concat_chunks(chunks) if chunks else pd.DataFrame(columns=header)
+    df.attrs['sheet_rows'] = sheet_rows
+    return df
+
+
+# Function to fetch every range in one batchGet request
+# All ranges share the timing of the single request
+def fetch_batch_values(session, ranges, api_key, retries=3, backoff=0.5, spreadsheet_id=SPREADSHEET_ID,
+                       base_url=None):
+    start = time.perf_counter()
+    names = list(ranges)
+    url = build_batch_url([ranges[name] for name in names], api_key, spreadsheet_id, base_url)
+    data = get_json_with_retry(session, url, retries=retries, backoff=backoff)
+    elapsed = time.perf_counter() - start
+    if data is None:
+        return {name: None for name in names}, {name: elapsed for name in names}
+    value_ranges = data.get('valueRanges', [])  # Returned in the same order as requested
+    values = {name: value_range.get('values', []) for name, value_range in zip(names, value_ranges)}
+    return values, {name: elapsed for name in names}
+
+
+# Function to fetch one range as a DataFrame, streaming it if it is open-ended
+# Returns the DataFrame (None when the fetch failed) and the seconds spent
+def fetch_range_frame(session, sheet_range, api_key, convert=None, retries=3, backoff=0.5,
+                      spreadsheet_id=SPREADSHEET_ID, base_url=None, block_rows=STREAM_BLOCK_ROWS):
+    start = time.perf_counter()
+    if is_open_ended(sheet_range):
+        df = stream_sheet_frame(session, sheet_range, api_key, block_rows, convert, retries, backoff,
+                                spreadsheet_id, base_url)
+    else:
+        decoded = fetch_range_decoded(session, sheet_range, api_key, retries, backoff, spreadsheet_id, base_url)
+        df = None
+        if decoded is not None:
+            df = decoded[1] if decoded[1] is not None else values_to_dataframe([])
+        if df is not None and convert:
+            df = convert(df)
+    return df, time.perf_counter() - start
+
+
+# Function to stream the rest of an open-ended range whose first block came with a batchGet request
+# `first_block` is the (converted) DataFrame of that block and `header` its column names
+# Returns the whole DataFrame (None when a block could not be fetched) and the seconds spent on the rest
+def fetch_rest_frame(session, sheet_range, api_key, first_block, header, convert=None, retries=3, backoff=0.5,
+                     spreadsheet_id=SPREADSHEET_ID, base_url=None, block_rows=STREAM_BLOCK_ROWS):
+    start = time.perf_counter()
+    rest = stream_sheet_frame(session, sheet_range, api_key, block_rows, convert, retries, backoff, spreadsheet_id,
+                              base_url, first_row=block_rows + 1, header=header)
+    df = rest
+    if rest is not None:
+        df = concat_chunks([first_block, rest]) if rest.attrs['sheet_rows'] else first_block
+        df.attrs['sheet_rows'] = first_block.attrs['sheet_rows'] + rest.attrs['sheet_rows']
+    return df, time.perf_counter() - start
+
+
+# Function to fetch several ranges at once as DataFrames
+# `converters` optionally maps a range name to a function applied to its DataFrame (per block when streaming)
+# Returns two dicts keyed like `ranges`: the DataFrames (None when the fetch failed) and the seconds spent per range
+def fetch_all_frames(ranges, api_key, batch=False, max_workers=8, retries=3, backoff=0.5, session=None,
+                     spreadsheet_id=SPREADSHEET_ID, base_url=None, block_rows=STREAM_BLOCK_ROWS, converters=None):
+    session = session or make_session(pool_size=max_workers)
+    converters = converters or {}
+    frames = {}
+    timings = {}
+
+    # In batch mode one batchGet request fetches every fixed range and the first block of every open-ended one;
+    # the open-ended ranges that had rows are then streamed on from their second block
+    if batch:
+        batch_ranges = {name: block_range(r, 1, block_rows) if is_open_ended(r) else r for name, r in ranges.items()}
+        values, timings = fetch_batch_values(session, batch_ranges, api_key, retries, backoff, spreadsheet_id,
+                                             base_url)
+        rest_headers = {}
+        for name, sheet_range in ranges.items():
+            df = None if values[name] is None else values_to_dataframe(values[name])
+            if df is not None:
+                sheet_rows = len(df)
+                if name in converters:
+                    df = converters[name](df)
+                df.attrs['sheet_rows'] = sheet_rows
+                if values[name] and is_open_ended(sheet_range):
+                    rest_headers[name] = values[name][0]
+            frames[name] = df
+
+    # The decode processes are shut down once every range is in
+    with using_decode_processes(), ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if batch:
+            futures = {
+                name: executor.submit(fetch_rest_frame, session, ranges[name], api_key, frames[name], header,
+                                      converters.get(name), retries, backoff, spreadsheet_id, base_url, block_rows)
+                for name, header in rest_headers.items()
+            }
+        else:
+            futures = {
+                name: executor.submit(fetch_range_frame, session, sheet_range, api_key, converters.get(name),
+                                      retries, backoff, spreadsheet_id, base_url, block_rows)
+                for name, sheet_range in ranges.items()
+            }
+        for name, future in futures.items():
+            frames[name], seconds = future.result()
+            timings[name] = timings.get(name, 0) + seconds
+    return frames, timings
@@ -0,0 +1,136 @@
+# Read-only snapshot files shared by the worker processes of the production server
+# The process that loads the data writes the aggregates as .npy files; every worker memory-maps the same files,
+# so the operating system keeps one copy in its page cache however many workers there are
+# The totals the charts show and the arrays of the title search index are written too, so a worker only maps files
+# when it switches to a new snapshot instead of recomputing them
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from sales_cube import MEASURES, TOTALS, SalesCube
+from sales_timeseries import SalesTimeSeries
+from title_search import TitleSearchIndex
+from bookshop_data import DataSnapshot
+from data_refresher import SnapshotStore
+
+# Name of the file pointing at the current snapshot folder
+CURRENT_FILE = "CURRENT"
+
+# Arrays of the TitleSearchIndex written to the snapshot folder (as search_<name>.npy)
+SEARCH_ARRAYS = ['ranking', 'words', 'ranks', 'offsets']
+
+
+# Function to memory-map one array of a snapshot folder read-only
+def load_array(path, name):
+    return np.load(os.path.join(path, name + ".npy"), mmap_mode='r')
+
+
+# Function to write the parts of a snapshot the dashboard serves from into a new folder under `root`
+# and point CURRENT at it; older folders beyond the newest `keep` are removed
+def write_snapshot(snapshot, root, keep=2):
+    versions_dir = os.path.join(root, "versions")
+    os.makedirs(versions_dir, exist_ok=True)
+    name = f"{snapshot.version}-{time.time_ns()}"  # Unique even when a restarted process starts again at version 1
+    tmp_dir = os.path.join(versions_dir, name + ".tmp")
+    os.makedirs(tmp_dir)
+
+    sales_cube = snapshot.sales_cube
+    for measure in MEASURES:
+        np.save(os.path.join(tmp_dir, measure + ".npy"), np.ascontiguousarray(getattr(sales_cube, measure)))
+    for total in TOTALS:
+        np.save(os.path.join(tmp_dir, total + ".npy"), np.ascontiguousarray(sales_cube.totals[total]))
+    np.save(os.path.join(tmp_dir, "daily_orders_cumulative.npy"), snapshot.sales_timeseries.cumulative)
+    np.save(os.path.join(tmp_dir, "total_daily_orders_cumulative.npy"), snapshot.sales_timeseries.total_cumulative)
+    for array_name in SEARCH_ARRAYS:
+        np.save(os.path.join(tmp_dir, "search_" + array_name + ".npy"), getattr(snapshot.title_search, array_name))
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as meta_file:
+        json.dump({
+            'version': snapshot.version,
+            'titles': [str(title) for title in sales_cube.titles],
+            'quarters': [str(quarter) for quarter in sales_cube.quarters],
+            'authors': sales_cube.authors,
+            'first_day': str(snapshot.sales_timeseries.first_day),
+            'isbns': snapshot.title_search.isbns,  # Per title, for the search index of the book selector
+        }, meta_file)
+    os.rename(tmp_dir, os.path.join(versions_dir, name))
+
+    # Switch CURRENT over in one atomic rename, so workers never see a half-written snapshot
+    tmp_path = os.path.join(root, CURRENT_FILE + ".tmp")
+    with open(tmp_path, "w") as current_file:
+        current_file.write(name)
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+
+    # Workers that still have an older version mapped keep reading it until they switch
+    names = sorted((n for n in os.listdir(versions_dir) if not n.endswith(".tmp")),
+                   key=lambda n: int(n.split("-")[1]))
+    for old_name in names[:-keep]:
+        shutil.rmtree(os.path.join(versions_dir, old_name), ignore_errors=True)
+    return name
+
+
+# Function to load a snapshot folder, memory-mapping its arrays read-only
+def read_snapshot(path):
+    with open(os.path.join(path, "meta.json")) as meta_file:
+        meta = json.load(meta_file)
+    counts = {measure: load_array(path, measure) for measure in MEASURES}
+    totals = {name: load_array(path, name) for name in TOTALS}
+    sales_cube = SalesCube(meta['titles'], meta['quarters'], counts, meta['authors'], totals=totals)
+    sales_timeseries = SalesTimeSeries(meta['titles'], meta['first_day'], load_array(path, "daily_orders_cumulative"),
+                                       total_cumulative=load_array(path, "total_daily_orders_cumulative"))
+    title_search = TitleSearchIndex(meta['titles'], meta['authors'], meta['isbns'],
+                                    *[load_array(path, "search_" + name) for name in SEARCH_ARRAYS])
+    # Workers only serve the aggregates; the merged table and the sheets stay in the loading process
+    return DataSnapshot(meta['version'], {}, {}, {}, {}, None, sales_cube, sales_timeseries, title_search)
+
+
+class SnapshotFileStore(SnapshotStore):
+    # Snapshot store of a worker process: follows the CURRENT file written by the loading process
+    # A SnapshotWatcher thread checks it every `check_interval` seconds and swaps new snapshots in, so requests only
+    # ever read `store.snapshot` and never wait for a snapshot to be read
+    def __init__(self, root, check_interval=1.0):
+        self.root = root
+        self.current_name = None
+        super().__init__()
+        self.reload_if_changed()
+        self.refresher = SnapshotWatcher(self, check_interval)
+        self.refresher.start()
+
+    # Read the snapshot CURRENT points at if it is not the one being served; returns True if one was swapped in
+    def reload_if_changed(self):
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE)) as current_file:
+                name = current_file.read().strip()
+        except FileNotFoundError:
+            return False  # The loading process has not written the first snapshot yet
+        if name == self.current_name:
+            return False
+        snapshot = read_snapshot(os.path.join(self.root, "versions", name))
+        self.current_name = name
+        self.swap(snapshot)
+        return True
+
+    def stop(self):
+        self.refresher.stop()
+
+
+class SnapshotWatcher(threading.Thread):
+    # Reloads the store of a worker process whenever the loading process points CURRENT at a new snapshot folder
+    def __init__(self, store, check_interval=1.0):
+        super().__init__(name="snapshot-watcher", daemon=True)
+        self.store = store
+        self.check_interval = check_interval
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.wait(self.check_interval):
+            try:
+                self.store.reload_if_changed()
+            except Exception as error:  # Keep serving the current snapshot if the new one cannot be read
+                print(f"Reading the snapshot files failed: {error}")
+
+    def stop(self):
+        self.stop_event.set()
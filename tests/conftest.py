@@ -0,0 +1,32 @@
+# Shared fixtures: a local stand-in for the Sheets API, served from a thread of the test process
+import threading
+
+import pytest
+
+from benchmarks.sheets_stand_in import API_PATH, SheetsRequestHandler, make_stand_in_server
+
+
+class FlakyRequestHandler(SheetsRequestHandler):
+    # Answers 503 to the next `server.failures_left` requests, like the API does when it is overloaded
+    def do_GET(self):
+        with self.server.stats_lock:
+            fail = self.server.failures_left > 0
+            if fail:
+                self.server.failures_left -= 1
+        if fail:
+            return self.send_json(503, {'error': {'code': 503, 'message': "The service is currently unavailable."}})
+        super().do_GET()
+
+
+# A 1x synthetic spreadsheet; `stand_in.bookshop` can be changed by a test (e.g. to add Sales rows)
+@pytest.fixture
+def stand_in():
+    server = make_stand_in_server(scale=1)
+    server.RequestHandlerClass = FlakyRequestHandler
+    server.failures_left = 0
+    server.base_url = f"http://{server.server_address[0]}:{server.server_address[1]}{API_PATH}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import bookshop_data
+from bookshop_data import SALES_QUARTERS, apply_sales_delta, build_snapshot, load_sheet_frames, make_schema_converters
+from sales_cube import MEASURES
+from sheet_cache import SheetCache, load_ranges_cached
+from sheets_loader import SHEET_RANGES, make_session, stream_sheet_frame
+
+
+# Function to load every sheet from the stand-in into a snapshot, bypassing any cached copy
+def load_snapshot(stand_in, cache_dir):
+    return build_snapshot(load_sheet_frames("test", SheetCache(str(cache_dir), ttl=0), base_url=stand_in.base_url))
+
+
+# Function to key a (titles x quarters) measure of a cube by title, for comparing cubes whose titles are in a
+# different order
+def measure_by_title(sales_cube, measure):
+    return pd.DataFrame(np.asarray(getattr(sales_cube, measure)), index=sales_cube.titles,
+                        columns=sales_cube.quarters).sort_index()
+
+
+def test_sales_delta_matches_a_full_build(stand_in, tmp_path):
+    # Load the spreadsheet with some Sales rows not written yet (whole chunks of generated rows, so the rows that
+    # come later are the same as in the full sheet)
+    full_rows = dict(stand_in.bookshop.sales_rows)
+    stand_in.bookshop.sales_rows.update({'Sales Q1': 4000, 'Sales Q3': 12000, 'Sales Q4': 13000})
+    snapshot = load_snapshot(stand_in, tmp_path / "before")
+
+    # Then the rows appended since are read and added
+    stand_in.bookshop.sales_rows.update(full_rows)
+    session = make_session()
+    converters = make_schema_converters()
+    deltas = {}
+    for name in SALES_QUARTERS:
+        df = stream_sheet_frame(session, SHEET_RANGES[name], "test", convert=converters[name],
+                                base_url=stand_in.base_url, first_row=snapshot.sheet_rows[name] + 2,
+                                header=snapshot.sales_headers[name])
+        if df.attrs['sheet_rows']:
+            deltas[name] = df
+    assert set(deltas) == {'Sales Q1', 'Sales Q3', 'Sales Q4'}
+    updated = apply_sales_delta(snapshot, deltas)
+
+    full = load_snapshot(stand_in, tmp_path / "after")
+    assert updated.version == snapshot.version + 1
+    assert updated.sheet_rows == full.sheet_rows
+    assert sorted(updated.sales_cube.titles) == sorted(full.sales_cube.titles)
+    for measure in MEASURES:
+        if measure == 'rating_sum':
+            continue  # Ratings are random per merged row (the sheets have none), so only their count can match
+        pd.testing.assert_frame_equal(measure_by_title(updated.sales_cube, measure),
+                                      measure_by_title(full.sales_cube, measure), check_dtype=False)
+    pd.testing.assert_frame_equal(updated.sales_cube.book_sales.sort_values('Title', ignore_index=True),
+                                  full.sales_cube.book_sales.sort_values('Title', ignore_index=True),
+                                  check_dtype=False)
+    assert updated.sales_cube.top_sales['Total Sales'].tolist() == full.sales_cube.top_sales['Total Sales'].tolist()
+
+    pd.testing.assert_frame_equal(updated.sales_timeseries.trend(), full.sales_timeseries.trend(), check_dtype=False)
+    for title in full.sales_cube.titles[:5]:
+        pd.testing.assert_frame_equal(updated.sales_timeseries.trend(title, granularity='week'),
+                                      full.sales_timeseries.trend(title, granularity='week'), check_dtype=False)
+    assert len(updated.df_merged) == len(full.df_merged)
+
+
+def test_empty_sales_delta_keeps_the_aggregates(stand_in, tmp_path):
+    snapshot = load_snapshot(stand_in, tmp_path)
+    updated = apply_sales_delta(snapshot, {})
+    assert updated.sales_cube is snapshot.sales_cube
+    assert updated.title_search is snapshot.title_search
+    assert updated.sheet_rows == snapshot.sheet_rows
+
+
+def test_offline_load_without_snapshots_names_the_missing_ranges(tmp_path):
+    with pytest.raises(RuntimeError, match=r"No cached snapshot for Book \(offline\), Sales Q1 \(offline\)"):
+        load_sheet_frames("test", SheetCache(str(tmp_path), offline=True))
+
+
+def test_failed_fetch_without_snapshot_names_the_range(stand_in, tmp_path):
+    stand_in.failures_left = 10
+    with pytest.raises(RuntimeError, match=r"No cached snapshot for Book \(API failed\)"):
+        load_ranges_cached({'Book': SHEET_RANGES['Book']}, "test", SheetCache(str(tmp_path), ttl=0), retries=2,
+                           backoff=0, base_url=stand_in.base_url)
+
+
+def test_cached_typed_snapshots_are_not_converted_again(stand_in, tmp_path, monkeypatch):
+    load_sheet_frames("test", SheetCache(str(tmp_path), ttl=0), base_url=stand_in.base_url)
+    monkeypatch.setattr(bookshop_data, 'apply_schema', lambda *args: pytest.fail("schema applied again"))
+    frames = load_sheet_frames("test", SheetCache(str(tmp_path), offline=True))
+    assert set(frames) == set(SHEET_RANGES)
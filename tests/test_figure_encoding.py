@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from figure_encoding import compact_figure, decode_array, lttb
+
+
+@pytest.mark.parametrize('n, n_out', [(10000, 800), (801, 800), (1000, 3), (5000, 999)])
+def test_lttb_keeps_the_endpoints_and_picks_increasing_points(n, n_out):
+    rng = np.random.default_rng(n)
+    x = np.arange(n, dtype=np.float64)
+    y = np.cumsum(rng.normal(size=n))
+    kept = lttb(x, y, n_out)
+    assert len(kept) == n_out
+    assert kept[0] == 0 and kept[-1] == n - 1
+    assert np.all(np.diff(kept) > 0)
+
+
+def test_lttb_keeps_a_spike():
+    y = np.zeros(10000)
+    y[4321] = 100.0
+    assert 4321 in lttb(np.arange(10000), y, 100)
+
+
+@pytest.mark.parametrize('n, n_out', [(100, 100), (100, 500), (100, 2), (0, 10)])
+def test_lttb_keeps_every_point_when_there_is_nothing_to_drop(n, n_out):
+    assert lttb(np.arange(n), np.arange(n), n_out).tolist() == list(range(n))
+
+
+def test_compact_figure_downsamples_lines_and_sends_typed_arrays():
+    n = 5000
+    figure = {'data': [{'type': 'scatter', 'mode': 'lines', 'x': list(range(n)), 'y': [i * i for i in range(n)]},
+                       {'type': 'bar', 'x': ['a', 'b'], 'y': [3_000_000_000, 1]}]}
+    compact_figure(figure, max_points=800)
+    line, bar = figure['data']
+    x, y = decode_array(line['x']), decode_array(line['y'])
+    assert len(x) == len(y) == 800
+    assert x[0] == 0 and x[-1] == n - 1
+    assert np.array_equal(y, x.astype(np.int64) ** 2)
+    assert bar['x'] == ['a', 'b']
+    assert decode_array(bar['y']).tolist() == [3_000_000_000, 1]  # Beyond 32-bit signed, still exact
+
+
+def test_compact_figure_sends_dates_as_milliseconds_on_a_date_axis():
+    figure = {'data': [{'type': 'scatter', 'mode': 'lines', 'x': ['2022-01-01', '2022-01-02'], 'y': [1, 2]}],
+              'layout': {'xaxis': {'type': 'date'}}}
+    compact_figure(figure)
+    assert decode_array(figure['data'][0]['x']).tolist() == [1640995200000.0, 1641081600000.0]
+
+
+def test_compact_figure_sends_dates_of_datetime_columns():
+    figure = {'data': [{'type': 'scatter', 'mode': 'lines', 'x': ['2022-01-01', '2022-01-02'], 'y': [1, 2]}]}
+    compact_figure(figure, dates={(0, 'x')})
+    assert figure['layout']['xaxis']['type'] == 'date'
+    assert decode_array(figure['data'][0]['x']).tolist() == [1640995200000.0, 1641081600000.0]
+
+
+def test_compact_figure_keeps_date_like_labels_as_text():
+    figure = {'data': [{'type': 'bar', 'x': ['2022-01-01', '2022-01-02'], 'y': [1, 2]}],
+              'layout': {'xaxis': {'type': 'category'}}}
+    compact_figure(figure)
+    assert figure['data'][0]['x'] == ['2022-01-01', '2022-01-02']
+    assert figure['layout']['xaxis'] == {'type': 'category'}
+    figure = {'data': [{'type': 'bar', 'x': ['2022-01-01', '2022-01-02'], 'y': [1, 2]}]}
+    compact_figure(figure)
+    assert figure['data'][0]['x'] == ['2022-01-01', '2022-01-02']
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sales_timeseries import SalesTimeSeries
+
+
+# Merged sales rows of a few titles over about half a year, some without an order or a sale date
+@pytest.fixture
+def df_merged():
+    rng = np.random.default_rng(7)
+    n = 5000
+    titles = np.array(["Alpha", "Beta", "Gamma", "Delta"])[rng.integers(0, 4, n)]
+    dates = pd.Timestamp("2022-01-03") + pd.to_timedelta(rng.integers(0, 180, n), unit='D')
+    order_ids = pd.Series([f"O{i}" for i in rng.integers(0, 3000, n)], dtype=object)
+    order_ids[rng.random(n) < 0.05] = None
+    df = pd.DataFrame({'Title': titles, 'Sale Date': dates, 'OrderID': order_ids})
+    df.loc[rng.random(n) < 0.05, 'Sale Date'] = pd.NaT
+    return df
+
+
+# Function to count the orders per bucket with a groupby, the way the trend chart used to be built
+def grouped_orders(df, title, start, end, granularity):
+    dated = df[df['Sale Date'].notna() & df['OrderID'].notna()]
+    if title is not None:
+        dated = dated[dated['Title'] == title]
+    dated = dated[(dated['Sale Date'] >= start) & (dated['Sale Date'] <= end)]
+    dates = dated['Sale Date']
+    if granularity == 'week':
+        dates = dates - pd.to_timedelta(dates.dt.dayofweek, unit='D')  # Weeks start on Monday
+    elif granularity == 'month':
+        dates = dates.dt.to_period('M').dt.start_time
+    buckets = dates.clip(lower=start)  # The first bucket starts at the first requested day
+    return buckets.groupby(buckets).size()
+
+
+@pytest.mark.parametrize('granularity', ['day', 'week', 'month'])
+@pytest.mark.parametrize('title', [None, "Beta"])
+@pytest.mark.parametrize('start, end', [(None, None), ("2022-02-10", "2022-05-17")])
+def test_trend_matches_a_groupby(df_merged, granularity, title, start, end):
+    series = SalesTimeSeries.from_merged(df_merged, ["Alpha", "Beta", "Gamma", "Delta"])
+    trend = series.trend(title, start, end, granularity)
+
+    start = pd.Timestamp(start or df_merged['Sale Date'].min())
+    end = pd.Timestamp(end or df_merged['Sale Date'].max())
+    expected = grouped_orders(df_merged, title, start, end, granularity)
+    # Buckets without orders are kept by the trend (with 0 orders) and left out by the groupby
+    assert trend['Orders'].sum() == expected.sum()
+    assert trend['Date'].iloc[0] == start
+    orders = trend.set_index('Date')['Orders']
+    assert orders[orders > 0].to_dict() == {date: count for date, count in expected.items()}
+
+
+def test_trend_of_an_unknown_title_or_empty_range_has_no_orders(df_merged):
+    series = SalesTimeSeries.from_merged(df_merged, ["Alpha", "Beta", "Gamma", "Delta"])
+    assert series.trend("Omega")['Orders'].sum() == 0
+    assert len(series.trend(start="2022-05-01", end="2022-04-01")) == 0
@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+import sheet_decoder
+from sheet_decoder import decode_in_processes, decode_value_range, using_decode_processes
+from sheets_loader import SHEET_RANGES, fetch_all_frames
+
+
+# Use two decode processes for any response, inside one load that ends with the test
+@pytest.fixture
+def decode_processes(monkeypatch):
+    monkeypatch.setattr(sheet_decoder, 'DECODE_PROCESSES', 2)
+    monkeypatch.setattr(sheet_decoder, 'PARALLEL_DECODE_BYTES', 1)
+    monkeypatch.setattr(sheet_decoder, 'pool_failures', 0)
+    with using_decode_processes():
+        yield
+    assert sheet_decoder.decode_pool is None
+
+
+# Function to build a `values` response body the way the Sheets API lays it out
+def response_body(rows):
+    return json.dumps({'range': "Sales Q1!A1:E5000", 'majorDimension': 'ROWS', 'values': rows}).encode()
+
+
+# Function to decode a response in this process only
+def decode_serially(raw, header=None):
+    processes = sheet_decoder.DECODE_PROCESSES
+    sheet_decoder.DECODE_PROCESSES = 1
+    try:
+        return decode_value_range(raw, header)
+    finally:
+        sheet_decoder.DECODE_PROCESSES = processes
+
+
+HEADER = ['Sale Date', 'ISBN', 'Discount', 'ItemID', 'OrderID']
+
+
+def sales_rows(n, odd_cell, every=5):
+    rows = []
+    for i in range(n):
+        row = ['1/3/2022', f"978-{i:09d}", '0.1' if i % 3 else '', f"I{i}", f"O{i // 2}"]
+        if i % 7 == 0:
+            row = row[:3]  # Trailing empty cells are left out
+        if i % every == 0:
+            row[1] = odd_cell
+        rows.append(row)
+    return rows
+
+
+def test_decode_processes_match_the_serial_decode(decode_processes):
+    raw = response_body([HEADER] + sales_rows(3000, "978-000000000"))
+    header, df = decode_value_range(raw)
+    assert decode_in_processes(raw, None) is not None  # Decoded on the pool, not by the fallback
+    serial_header, serial_df = decode_serially(raw)
+    assert header == serial_header == HEADER
+    assert df.equals(serial_df)
+    assert len(df) == 3000
+
+
+@pytest.mark.parametrize('odd_cell', ['],[', 'a"],["b', '] , [', '\\"],[\\"'])
+def test_row_boundaries_inside_cells_are_not_split(decode_processes, odd_cell):
+    # Most of every row is a cell looking like row boundaries, so the cut between the two chunks falls inside one
+    raw = response_body([HEADER] + sales_rows(3000, odd_cell * 100, every=1))
+    start, end = sheet_decoder.find_values_array(raw)
+    chunks = sheet_decoder.split_rows(raw[start + 1:end], 2)
+    assert not chunks[1].startswith(b'["1/3/2022"')
+
+    header, df = decode_value_range(raw)
+    serial_header, serial_df = decode_serially(raw)
+    assert header == serial_header
+    assert df.equals(serial_df)
+    assert df['ISBN'].iloc[0] == odd_cell * 100
+    assert sheet_decoder.pool_failures == 0
+
+
+def test_known_header_and_empty_ranges(decode_processes):
+    raw = response_body(sales_rows(100, "978-000000000"))
+    header, df = decode_value_range(raw, HEADER)
+    assert df.equals(decode_serially(raw, HEADER)[1])
+    assert len(df) == 100
+
+    empty = json.dumps({'range': "Sales Q1!A5001:E10000", 'majorDimension': 'ROWS'}).encode()
+    assert decode_value_range(empty, HEADER) == (HEADER, None)
+
+
+def test_no_decode_processes_are_left_after_a_load(stand_in, monkeypatch):
+    monkeypatch.setattr(sheet_decoder, 'DECODE_PROCESSES', 2)
+    monkeypatch.setattr(sheet_decoder, 'PARALLEL_DECODE_BYTES', 1)
+    monkeypatch.setattr(sheet_decoder, 'pool_failures', 0)
+    pools = []
+    get_decode_pool = sheet_decoder.get_decode_pool
+    monkeypatch.setattr(sheet_decoder, 'get_decode_pool', lambda: pools.append(get_decode_pool()) or pools[-1])
+    ranges = {name: SHEET_RANGES[name] for name in ['Book', 'Sales Q1']}
+    frames, _ = fetch_all_frames(ranges, "test", base_url=stand_in.base_url)
+    assert all(len(df) for df in frames.values())
+    assert pools  # The responses were decoded on the pool
+    assert sheet_decoder.decode_pool is None and sheet_decoder.pool_users == 0
+    assert not pools[-1]._processes  # ...and its processes have exited
+
+    # Outside a load, responses are decoded in the calling thread
+    pools.clear()
+    decode_value_range(response_body([HEADER] + sales_rows(10, "978-000000000")))
+    assert not pools
@@ -0,0 +1,76 @@
+from benchmarks.synthetic_sheets import BASE_BOOKS, BASE_SALES_ROWS, HEADERS
+from sheets_loader import SHEET_RANGES, fetch_all_frames, make_session, stream_sheet_frame
+
+
+# Function to list one column of sheet rows the way they are decoded: cells left out at the end of a row (and empty
+# cells) are missing values, shown here as ''
+def column(rows, i):
+    return [row[i] if i < len(row) else '' for row in rows]
+
+
+def test_concurrent_and_batch_fetches_return_the_same_frames(stand_in):
+    concurrent, _ = fetch_all_frames(SHEET_RANGES, "test", base_url=stand_in.base_url, block_rows=5000)
+    requests_concurrent = stand_in.stats['requests']
+    batched, _ = fetch_all_frames(SHEET_RANGES, "test", batch=True, base_url=stand_in.base_url, block_rows=5000)
+
+    for name in SHEET_RANGES:
+        assert concurrent[name].equals(batched[name]), name
+        assert concurrent[name].attrs['sheet_rows'] == batched[name].attrs['sheet_rows'] == len(batched[name])
+    assert len(batched['Book']) == BASE_BOOKS
+    assert len(batched['Sales Q3']) == BASE_SALES_ROWS['Sales Q3']
+    # The first blocks of all 7 ranges come in one request instead of 7
+    assert stand_in.stats['requests'] - requests_concurrent == requests_concurrent - 6
+
+
+def test_fetch_retries_server_errors(stand_in):
+    stand_in.failures_left = 2
+    frames, _ = fetch_all_frames({'Book': SHEET_RANGES['Book']}, "test", retries=3, backoff=0,
+                                 base_url=stand_in.base_url)
+    assert len(frames['Book']) == BASE_BOOKS
+    assert stand_in.failures_left == 0
+
+
+def test_batch_fetch_retries_server_errors(stand_in):
+    stand_in.failures_left = 1
+    frames, _ = fetch_all_frames({'Book': SHEET_RANGES['Book'], 'Sales Q1': SHEET_RANGES['Sales Q1']}, "test",
+                                 batch=True, retries=3, backoff=0, base_url=stand_in.base_url)
+    assert len(frames['Book']) == BASE_BOOKS
+    assert len(frames['Sales Q1']) == BASE_SALES_ROWS['Sales Q1']
+
+
+def test_fetch_gives_up_after_the_last_retry(stand_in):
+    stand_in.failures_left = 10
+    frames, _ = fetch_all_frames({'Book': SHEET_RANGES['Book']}, "test", retries=2, backoff=0,
+                                 base_url=stand_in.base_url)
+    assert frames['Book'] is None
+    assert stand_in.failures_left == 7
+
+
+def test_stream_reads_every_row_across_block_boundaries(stand_in):
+    session = make_session()
+    expected = stand_in.bookshop.sales_data_rows('Sales Q1', 0, BASE_SALES_ROWS['Sales Q1'])
+    for block_rows in [1000, 999, 7786]:
+        df = stream_sheet_frame(session, SHEET_RANGES['Sales Q1'], "test", block_rows=block_rows,
+                                base_url=stand_in.base_url)
+        assert list(df.columns) == HEADERS['Sales']
+        assert df.attrs['sheet_rows'] == len(df) == len(expected)
+        assert df['OrderID'].fillna('').tolist() == column(expected, 4)
+        assert df['Sale Date'].fillna('').tolist() == column(expected, 0)
+
+
+def test_stream_stops_when_the_sheet_ends_on_a_block_boundary(stand_in):
+    stand_in.bookshop.sales_rows['Sales Q1'] = 2999  # With the header, exactly 3 blocks of 1000 rows
+    df = stream_sheet_frame(make_session(), SHEET_RANGES['Sales Q1'], "test", block_rows=1000,
+                            base_url=stand_in.base_url)
+    assert len(df) == 2999
+
+
+def test_stream_reads_only_rows_after_a_known_row(stand_in):
+    df = stream_sheet_frame(make_session(), SHEET_RANGES['Sales Q1'], "test", block_rows=1000,
+                            base_url=stand_in.base_url, first_row=7002, header=HEADERS['Sales'])
+    expected = stand_in.bookshop.sales_data_rows('Sales Q1', 7000, BASE_SALES_ROWS['Sales Q1'])
+    assert df['OrderID'].fillna('').tolist() == column(expected, 4)
+
+    df = stream_sheet_frame(make_session(), SHEET_RANGES['Sales Q1'], "test", base_url=stand_in.base_url,
+                            first_row=BASE_SALES_ROWS['Sales Q1'] + 2, header=HEADERS['Sales'])
+    assert len(df) == 0 and df.attrs['sheet_rows'] == 0
@@ -0,0 +1,56 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from bookshop_data import apply_sales_delta, build_snapshot, load_sheet_frames
+from sheet_cache import SheetCache
+from snapshot_files import SnapshotFileStore, read_snapshot, write_snapshot
+
+
+# Function to load every sheet from the stand-in into a snapshot, bypassing any cached copy
+def load_snapshot(stand_in, cache_dir):
+    return build_snapshot(load_sheet_frames("test", SheetCache(str(cache_dir), ttl=0), base_url=stand_in.base_url))
+
+
+def test_snapshot_files_read_back_the_same_aggregates(stand_in, tmp_path):
+    snapshot = load_snapshot(stand_in, tmp_path / "cache")
+    name = write_snapshot(snapshot, str(tmp_path / "snapshots"))
+    read = read_snapshot(str(tmp_path / "snapshots" / "versions" / name))
+
+    cube, read_cube = snapshot.sales_cube, read.sales_cube
+    assert read.version == snapshot.version
+    assert read_cube.titles == cube.titles
+    assert np.array_equal(read_cube.total_sales, cube.total_sales)
+    assert read_cube.book_sales.equals(cube.book_sales)
+    assert read_cube.book_ratings.equals(cube.book_ratings)
+    assert read_cube.top_sales.equals(cube.top_sales)
+    assert read_cube.top_ratings.equals(cube.top_ratings)
+    pd.testing.assert_frame_equal(read.sales_timeseries.trend(granularity='week'),
+                                  snapshot.sales_timeseries.trend(granularity='week'))
+    for query in ["", "dragon", "the moon", "ada", "978-0000000", "zebra"]:
+        assert read.title_search.search(query) == snapshot.title_search.search(query), query
+
+    # The arrays are mapped from the files rather than rebuilt
+    assert isinstance(read.title_search.ranks, np.memmap)
+    assert isinstance(read_cube.totals['title_sales'], np.memmap)
+
+
+def test_store_swaps_in_new_snapshots_in_the_background(stand_in, tmp_path):
+    root = str(tmp_path / "snapshots")
+    store = SnapshotFileStore(root, check_interval=0.05)
+    try:
+        assert store.snapshot is None  # Nothing written yet
+        snapshot = load_snapshot(stand_in, tmp_path / "cache")
+        for expected_version in [1, 2]:
+            write_snapshot(snapshot, root)
+            deadline = time.monotonic() + 10
+            while (store.snapshot is None or store.snapshot.version != expected_version) and \
+                    time.monotonic() < deadline:
+                time.sleep(0.05)
+            assert store.snapshot.version == expected_version
+            snapshot = apply_sales_delta(snapshot, {})
+    finally:
+        store.stop()
+    store.refresher.join(5)
+    assert not store.refresher.is_alive()
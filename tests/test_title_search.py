@@ -0,0 +1,59 @@
+from title_search import TitleSearchIndex
+
+TITLES = ["The Dragon of the Moon", "Moon River", "Dragonfly Summer", "Café Noir", "The Dragon Reborn"]
+AUTHORS = ["Ada Adams", "Ben Brooks", "Chloe Chen", "Dev Diaz", "Ada Evans"]
+ISBNS = [["978-000000001"], ["978-000000002", "978-000000012"], [], ["978-000000004"], ["978-000000005"]]
+SALES = [30, 50, 10, 20, 40]
+
+
+def make_index():
+    return TitleSearchIndex.from_titles(TITLES, AUTHORS, ISBNS, SALES)
+
+
+def test_without_a_query_the_best_sellers_come_first():
+    index = make_index()
+    assert index.search("") == ["Moon River", "The Dragon Reborn", "The Dragon of the Moon", "Café Noir",
+                                "Dragonfly Summer"]
+    assert index.search("", limit=2) == ["Moon River", "The Dragon Reborn"]
+
+
+def test_words_match_by_prefix_best_sellers_first():
+    index = make_index()
+    assert index.search("drag") == ["The Dragon Reborn", "The Dragon of the Moon", "Dragonfly Summer"]
+    assert index.search("DRAGON") == ["The Dragon Reborn", "The Dragon of the Moon", "Dragonfly Summer"]
+    assert index.search("dragonfly") == ["Dragonfly Summer"]
+    assert index.search("caf") == ["Café Noir"]
+    assert index.search("zebra") == []
+    assert index.search("dragonflies-and-more-words-than-any-title-has") == []
+
+
+def test_every_word_must_match():
+    index = make_index()
+    assert index.search("dragon moon") == ["The Dragon of the Moon"]
+    assert index.search("moon dragon") == ["The Dragon of the Moon"]
+    assert index.search("ada drag") == ["The Dragon Reborn", "The Dragon of the Moon"]
+    assert index.search("dragon river") == []
+
+
+def test_isbns_match_with_or_without_dashes():
+    index = make_index()
+    assert index.search("978-000000012") == ["Moon River"]
+    assert index.search("978000000004") == ["Café Noir"]
+    assert index.search("978-00000000") == ["Moon River", "The Dragon Reborn", "The Dragon of the Moon", "Café Noir"]
+
+
+def test_options_and_authors_of_titles():
+    index = make_index()
+    options = index.options(["Moon River", "Unknown"])
+    assert options[0]['value'] == "Moon River"
+    assert "Ben Brooks" in options[0]['search'] and "978000000012" in options[0]['search']
+    assert options[1] == {'label': "Unknown", 'value': "Unknown"}
+    assert index.authors_of(["Café Noir", "Unknown"]) == {"Café Noir": "Dev Diaz"}
+
+
+def test_empty_index():
+    index = TitleSearchIndex.from_titles([], [], [], [])
+    assert index.search("") == []
+    assert index.search("dragon") == []
+    assert index.search("978-000000001") == []
+    assert index.options([]) == []
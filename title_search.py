@@ -0,0 +1,130 @@
+# Search index over the book titles, their authors and ISBNs for the book selector
+# Built once when the data is loaded, so the dropdown only ships the few best matches of what is typed instead of
+# every title in the catalogue: each word typed is a binary search in the sorted array of words, and the titles
+# matching every word are found with True/False arrays over the titles
+import re
+
+import numpy as np
+import pandas as pd
+
+# Titles offered when nothing is typed, and at most per search
+DEFAULT_LIMIT = 20
+
+# Words are runs of letters and digits; ISBNs are also indexed whole (with and without their dashes)
+WORD_PATTERN = re.compile(r"\w+")
+
+
+# Function to split a text into lowercase words
+def words(text):
+    return WORD_PATTERN.findall(str(text).lower())
+
+
+# Function to split what is typed into the words to look up; a part with dashes between digits is kept whole, as an
+# ISBN
+def query_words(query):
+    found = []
+    for part in str(query).lower().split():
+        if re.fullmatch(r"[\d-]*\d-[\d-]*", part):
+            found.append(part)
+        else:
+            found.extend(words(part))
+    return found
+
+
+class TitleSearchIndex:
+    # `titles`, `authors` and `isbns` (a list of ISBNs per title) follow the same title order (the order of the
+    # SalesCube); `ranking` lists the title positions best-selling first, and the index numbers titles by that rank
+    # `words` are the distinct words as sorted UTF-8 bytes, and `ranks` holds the ranks of the titles having each word,
+    # word after word (each word's ranks once and in rank order, those of word w between offsets[w] and
+    # offsets[w + 1]): all words starting with a prefix are next to each other, so the titles having any of them are
+    # one slice of `ranks`. These four arrays can be memory-mapped from a snapshot folder (see snapshot_files.py)
+    # Never modified after it is built: a new snapshot builds a new index
+    def __init__(self, titles, authors, isbns, ranking, words, ranks, offsets):
+        self.titles = titles
+        self.authors = authors
+        self.isbns = isbns
+        self.ranking = ranking
+        self.words = words
+        self.ranks = ranks
+        self.offsets = offsets
+        order = np.asarray(ranking).tolist()  # Plain ints: indexing a memory-mapped array one item at a time is slow
+        self.ranked_titles = [titles[i] for i in order]
+        self.ranked_authors = [authors[i] for i in order]
+        self.ranked_isbns = [isbns[i] for i in order]
+        self.rank_index = {title: rank for rank, title in enumerate(self.ranked_titles)}
+
+    # Build the index for titles with their authors, ISBNs and total sales
+    @classmethod
+    def from_titles(cls, titles, authors, isbns, total_sales):
+        # Sales rank of every title (0 = best selling); the index works on ranks only
+        ranking = np.argsort(-np.asarray(total_sales, dtype=np.int64), kind='stable')
+
+        # Words of every title, author name and ISBN, listed one title after the other
+        all_words = []
+        words_per_title = []
+        for i in ranking:
+            title_words = words(f"{titles[i]} {authors[i]}")
+            for isbn in isbns[i]:
+                isbn = str(isbn).lower()
+                title_words += [isbn, isbn.replace("-", "")]
+            all_words += title_words
+            words_per_title.append(len(title_words))
+        ranks = np.repeat(np.arange(len(titles), dtype=np.int64), words_per_title)
+
+        # The distinct words in sorted order (as bytes, which sort like the text), then the (word, rank) pairs
+        word_numbers, unique_words = pd.factorize(np.array(all_words, dtype=object))
+        encoded_words = np.array([word.encode() for word in unique_words], dtype=bytes)
+        word_order = np.argsort(encoded_words)
+        sorted_positions = np.empty(len(word_order), dtype=np.int64)
+        sorted_positions[word_order] = np.arange(len(word_order))
+        keys = np.sort(sorted_positions[word_numbers] * len(titles) + ranks)  # By word, then rank
+        if len(keys):
+            keys = keys[np.concatenate([[True], keys[1:] != keys[:-1]])]  # Words repeated within a title count once
+        return cls(titles, authors, isbns, ranking, encoded_words[word_order],
+                   (keys % max(len(titles), 1)).astype(np.int32),
+                   np.searchsorted(keys // max(len(titles), 1), np.arange(len(word_order) + 1)))
+
+    # Which titles (by sales rank) have a word that starts with `prefix`, as a True/False array
+    def prefix_mask(self, prefix):
+        prefix = prefix.encode()
+        mask = np.zeros(len(self.ranked_titles), dtype=bool)
+        width = self.words.dtype.itemsize
+        if len(prefix) > width:
+            return mask  # Longer than every word
+        first_word = np.searchsorted(self.words, prefix, 'left')
+        if len(prefix) < width:
+            last_word = np.searchsorted(self.words, prefix + b"\xff", 'left')  # 0xff never occurs in UTF-8
+        else:
+            last_word = np.searchsorted(self.words, prefix, 'right')  # Only the word itself can be that long
+        mask[self.ranks[self.offsets[first_word]:self.offsets[last_word]]] = True
+        return mask
+
+    # Best-selling titles matching every word of `query` (each word may be the start of a word of the title, author
+    # name or an ISBN); without a query, the best-selling titles
+    def search(self, query, limit=DEFAULT_LIMIT):
+        lookup_words = query_words(query) if query else []
+        if not lookup_words:
+            return self.ranked_titles[:limit]
+
+        matches = self.prefix_mask(lookup_words[0])
+        for word in lookup_words[1:]:
+            matches &= self.prefix_mask(word)
+        return [self.ranked_titles[rank] for rank in np.flatnonzero(matches)[:limit]]
+
+    # Dropdown options for a list of titles; the `search` text lets the dropdown's own filter keep titles matched on
+    # their author or ISBN
+    def options(self, titles):
+        options = []
+        for title in titles:
+            rank = self.rank_index.get(title)
+            if rank is None:
+                options.append({'label': title, 'value': title})
+                continue
+            isbns = " ".join(str(isbn) for isbn in self.ranked_isbns[rank])
+            options.append({'label': title, 'value': title,
+                            'search': f"{title} {self.ranked_authors[rank]} {isbns} {isbns.replace('-', '')}"})
+        return options
+
+    # Author of each of a list of titles, for the author lookup of the page
+    def authors_of(self, titles):
+        return {title: self.ranked_authors[self.rank_index[title]] for title in titles if title in self.rank_index}